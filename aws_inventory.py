@@ -0,0 +1,191 @@
+"""Run an inventory report across many (account x region) pairs in parallel.
+
+The get-*.py scripts each define a `collect(target)` generator yielding output rows (tuples) for a single account and
+region. This module fans those out over a thread pool, one Target (session + cached clients) per pair, and prints every
+row tab separated, prefixed with the account and region it came from.
+
+Accounts are read from a file like account-ids.txt ("<account id> <name>" per line), and each account is reached by
+assuming --role-name in it. Without --accounts, the current credentials are used as-is.
+"""
+
+import boto3
+import botocore.config
+import concurrent.futures
+import queue
+import threading
+
+
+# Adaptive retries add client-side rate limiting on top of exponential backoff, so concurrent workers slow down
+# together instead of failing with Throttling errors.
+BOTO_CONFIG = botocore.config.Config(retries={'mode': 'adaptive', 'max_attempts': 10})
+
+DEFAULT_ROLE_NAME = 'OrganizationAccountAccessRole'
+
+# GetMetricData accepts at most 500 metric queries per request.
+GET_METRIC_DATA_MAX_QUERIES = 500
+
+# Number of ids looked up per describe_* call by describe_by_id(). (A filter accepts at most 200 values.)
+ID_FILTER_BATCH_SIZE = 200
+
+# Most rows buffered between the collecting threads and the consumer of run(). A slow consumer holds the collectors
+# back instead of letting rows pile up in memory.
+RUN_QUEUE_SIZE = 1000
+
+# Put on run()'s queue by each target once its collect() is done.
+_DONE = object()
+
+
+class Target:
+  """A single (account, region) pair, with its own boto3 session and one cached client per service."""
+
+  def __init__(self, account_id, account_name, region, session):
+    self.account_id = account_id
+    self.account_name = account_name
+    self.region = region
+    self.session = session
+    self._clients = {}
+    self._lock = threading.Lock()
+
+  def client(self, service):
+    """Return the cached client for the given service, creating it on first use"""
+    with self._lock:
+      if service not in self._clients:
+        self._clients[service] = self.session.client(service, region_name=self.region, config=BOTO_CONFIG)
+      return self._clients[service]
+
+
+def read_account_ids(path):
+  """Return list of (account id, name) tuples from a file of '<account id> <name>' lines"""
+  accounts = []
+  with open(path) as account_file:
+    for line in account_file:
+      fields = line.split()
+      if fields and not fields[0].startswith('#'):
+        accounts.append((fields[0], fields[1] if len(fields) > 1 else fields[0]))
+  return accounts
+
+
+def assume_role_credentials(sts, account_id, role_name):
+  """Return boto3.Session keyword arguments for the given role in the given account"""
+  response = sts.assume_role(RoleArn='arn:aws:iam::{}:role/{}'.format(account_id, role_name),
+                             RoleSessionName='aws-inventory')
+  credentials = response['Credentials']
+  return {
+      'aws_access_key_id': credentials['AccessKeyId'],
+      'aws_secret_access_key': credentials['SecretAccessKey'],
+      'aws_session_token': credentials['SessionToken'],
+  }
+
+
+def get_targets(accounts_file=None, regions=('us-east-1',), role_name=DEFAULT_ROLE_NAME):
+  """Return a Target for every (account x region) pair. Use the region name 'all' for every enabled region."""
+  base_session = boto3.Session()
+  sts = base_session.client('sts', config=BOTO_CONFIG)
+  if 'all' in regions:
+    ec2 = base_session.client('ec2', region_name='us-east-1', config=BOTO_CONFIG)
+    regions = sorted(region['RegionName'] for region in ec2.describe_regions()['Regions'])
+
+  targets = []
+  if accounts_file:
+    for account_id, account_name in read_account_ids(accounts_file):
+      # Assume the role once per account, but give every pair its own session, since sessions aren't thread safe.
+      credentials = assume_role_credentials(sts, account_id, role_name)
+      for region in regions:
+        targets.append(Target(account_id, account_name, region, boto3.Session(**credentials)))
+  else:
+    account_id = sts.get_caller_identity()['Account']
+    for region in regions:
+      targets.append(Target(account_id, account_id, region, boto3.Session()))
+  return targets
+
+
+def get_metric_data(cloudwatch, queries, start_time, end_time):
+  """Return dict of query id -> list of values for the given GetMetricData queries, batched 500 queries per request and
+  paging through the results."""
+  values = {query['Id']: [] for query in queries}
+  paginator = cloudwatch.get_paginator('get_metric_data')
+  for i in range(0, len(queries), GET_METRIC_DATA_MAX_QUERIES):
+    for page in paginator.paginate(MetricDataQueries=queries[i:i + GET_METRIC_DATA_MAX_QUERIES],
+                                   StartTime=start_time, EndTime=end_time):
+      for result in page['MetricDataResults']:
+        values[result['Id']].extend(result['Values'])
+  return values
+
+
+def describe_by_id(client, operation, result_key, id_filter, ids, filters=None):
+  """Yield the resources returned by the given describe_* paginator for only the given ids (and any other filters), in
+  batches. The id filter is used instead of e.g. VpcIds=[...], so an id which no longer exists doesn't fail the whole
+  batch."""
+  ids = sorted(set(ids))
+  paginator = client.get_paginator(operation)
+  for i in range(0, len(ids), ID_FILTER_BATCH_SIZE):
+    batch_filters = [{'Name': id_filter, 'Values': ids[i:i + ID_FILTER_BATCH_SIZE]}] + (filters or [])
+    for page in paginator.paginate(Filters=batch_filters):
+      yield from page[result_key]
+
+
+def add_arguments(parser):
+  """Add the --accounts, --regions, --role-name and --workers options to an argparse parser"""
+  parser.add_argument('--accounts', metavar='FILE',
+                      help='file of "<account id> <name>" lines, e.g. account-ids.txt (default: current credentials)')
+  parser.add_argument('--regions', nargs='+', default=['us-east-1'],
+                      help='regions to report on, or "all" (default: %(default)s)')
+  parser.add_argument('--role-name', default=DEFAULT_ROLE_NAME,
+                      help='role to assume in each account (default: %(default)s)')
+  parser.add_argument('--workers', type=int, default=8,
+                      help='number of (account, region) pairs to run concurrently (default: %(default)s)')
+
+
+def run(collect, targets, workers=8):
+  """Run collect(target) for every target concurrently, yielding (target, row) for each row as soon as it is collected.
+  Rows from different targets are interleaved, and at most RUN_QUEUE_SIZE are buffered at once. An exception from
+  collect() is raised when that target finishes."""
+  rows = queue.Queue(maxsize=RUN_QUEUE_SIZE)
+  stopped = threading.Event()
+
+  def put(item):
+    """Queue an item, returning False instead if the consumer has gone away."""
+    while not stopped.is_set():
+      try:
+        rows.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def produce(target):
+    try:
+      for row in collect(target):
+        if not put((target, row)):
+          return
+    finally:
+      put((target, _DONE))
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    futures = {target: executor.submit(produce, target) for target in targets}
+    try:
+      remaining = len(futures)
+      while remaining:
+        target, row = rows.get()
+        if row is _DONE:
+          remaining -= 1
+          futures[target].result()
+        else:
+          yield target, row
+    finally:
+      # If we stop early (an error, or the caller closing the generator), don't wait for every target to finish.
+      stopped.set()
+      for future in futures.values():
+        future.cancel()
+
+
+def main(collect, args, sort_key=None):
+  """Run collect over the targets selected by args (see add_arguments()) and print every row, tab separated, prefixed
+  with its account name and region as soon as it arrives. If sort_key is given, rows from all targets are collected and
+  printed sorted by sort_key(row) instead."""
+  targets = get_targets(args.accounts, args.regions, args.role_name)
+  rows = run(collect, targets, args.workers)
+  if sort_key:
+    rows = sorted(rows, key=lambda target_row: sort_key(target_row[1]))
+  for target, row in rows:
+    print('\t'.join(str(column) for column in (target.account_name, target.region) + tuple(row)))
@@ -6,23 +6,54 @@ Find the CircleCI pipeline & workflow(s) for a given git commit, wait for it
 to finish, and exit with appropriate return code and status message. Also emit
 the CCI Pipeline URL as a convenience for the end user.
 
+With --targets, watch many commits at once: FILE (or - for stdin) lists one
+"vcs/org/project branch commit" target per line. Every pipeline's result is
+printed as it finishes, and the exit status is non-zero if any of them failed.
+All targets share one connection pool and one --rate limit.
+
 Usage:
     check_workflow_status.py [options] --branch=VCS_BRANCH --commit=VCS_COMMIT
+    check_workflow_status.py [options] --targets=FILE
     check_workflow_status.py --help
 
 Options:
     --vcs=VCS       Version Control System (github|bitbucket) [default: github]
     --org=ORG       VCS organization [default: jeffreymlewis]
     --project=PROJECT  Project in the VCS org [default: scripts]
+    --timeout=SECONDS  Give up waiting after this many seconds, 0 waits
+                    forever [default: 0]
+    --min-poll=SECONDS  First delay between workflow status polls
+                    [default: 1]
+    --max-poll=SECONDS  Longest delay between workflow status polls
+                    [default: 30]
+    --index=FILE    Local cache of commit -> pipeline lookups
+                    [default: ~/.cache/check_workflow_status.json]
+    --max-pages=N   Stop searching for the commit after this many pages of
+                    pipelines, 0 for no limit [default: 50]
+    --max-age=DAYS  Stop searching for the commit at pipelines older than
+                    this, 0 for no limit [default: 90]
+    --rate=N        Most CircleCI API requests per second, shared by all
+                    targets [default: 10]
+    --fail-fast     Also watch the jobs of running workflows, and stop as
+                    soon as any job fails
     -h, --help      Show this screen
 """
 
+import asyncio
+import concurrent.futures
+import contextlib
+import datetime
+import email.utils
+import json
 import os
+import random
+import threading
 import time
 import sys
 
 import docopt    # pylint: disable=import-error
 import requests  # pylint: disable=import-error
+import requests.adapters  # pylint: disable=import-error
 
 # CircleCI API endpoint
 CIRCLE_API_ENDPOINT = 'https://circleci.com/api/v2'
@@ -34,6 +65,148 @@ CIRCLE_FAILURE_STATUS = {'failed', 'error', 'failing', 'canceled',
 CIRCLE_SUCCESS_STATUS = {'success', 'not_run'}
 CIRCLE_WAITING_STATUS = {'running', 'on_hold'}
 
+# Workflow status messages whose jobs can still change. A 'failing' workflow
+# already has a failed job, while its other jobs are still running.
+CIRCLE_RUNNING_STATUS = {'running', 'failing'}
+
+# Job status messages which mean a job has failed, for --fail-fast.
+# https://circleci.com/docs/api/v2/#operation/listWorkflowJobs
+CIRCLE_JOB_FAILURE_STATUS = {'failed', 'infrastructure_fail', 'timedout',
+                             'terminated-unknown', 'canceled',
+                             'unauthorized'}
+
+# HTTP status codes meaning "slow down and try again".
+RETRY_HTTP_STATUS = {429, 502, 503, 504}
+MAX_API_RETRIES = 8
+
+# (connect, read) timeout in seconds for every API request, so a hung
+# connection can't block forever.
+HTTP_TIMEOUT = (5, 30)
+
+# Most pipelines remembered per project/branch in the commit -> pipeline index.
+# Searches stop at the index's newest known pipeline, so they won't find a
+# commit which has been dropped from it: keep this well above the
+# --max-pages * 20 pipelines a search could otherwise reach.
+INDEX_MAX_PIPELINES = 10000
+
+# Shared HTTP session, so every API call reuses the same keep-alive
+# connection pool instead of opening a new TCP/TLS connection.
+_SESSION = None
+
+# Set in --targets mode, so every API call from every target goes through
+# the same request scheduler.
+_RATE_LIMITER = None
+
+# time.monotonic() deadline for --timeout, or None to wait forever. Checked
+# before every API request and retry sleep, not just between polls.
+_DEADLINE = None
+
+
+class CircleCIError(Exception):
+    """A CircleCI API request failed, or the --timeout deadline passed. main()
+    exits with it, while in --targets mode only its own target fails."""
+
+
+class _RateLimiter:
+    """Space API requests out to at most `rate` per second, across all
+    threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block until the next request slot."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(slot - now)
+
+
+def _get_session() -> requests.Session:
+    """Return the shared, connection pooling CircleCI API session."""
+    global _SESSION  # pylint: disable=global-statement
+    if _SESSION is None:
+        _SESSION = requests.Session()
+        _SESSION.headers['Circle-Token'] = os.environ['CIRCLE_API_TOKEN']
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4,
+                                                pool_maxsize=16)
+        _SESSION.mount('https://', adapter)
+    return _SESSION
+
+
+def _retry_after(response: requests.Response) -> float:
+    """Return the number of seconds a rate limited response asks us to wait,
+    from its Retry-After header (either seconds or an HTTP date), or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _backoff_delays(minimum: float, maximum: float):
+    """Yield poll delays which start at `minimum` and grow geometrically
+    toward `maximum`. Each delay is jittered, so many jobs waiting at once
+    don't poll the API in lockstep."""
+    delay = minimum
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(maximum, delay * 1.5)
+
+
+def _check_deadline(delay: float = 0) -> None:
+    """Raise CircleCIError if waiting another `delay` seconds would pass the
+    --timeout deadline."""
+    if _DEADLINE and time.monotonic() + delay > _DEADLINE:
+        raise CircleCIError('Timed out waiting for CircleCI')
+
+
+def _api_get(url: str, params: dict = None) -> dict:
+    """GET a CircleCI API endpoint and return the decoded JSON response.
+    Rate limited (HTTP 429) and temporarily unavailable responses, and
+    connection errors and timeouts, are retried, honoring Retry-After when
+    the server sends one. Raises CircleCIError once the retries run out, at
+    the --timeout deadline, or if the response isn't JSON."""
+    delays = _backoff_delays(1, 60)
+    for attempt in range(MAX_API_RETRIES):
+        _check_deadline()
+        if _RATE_LIMITER:
+            _RATE_LIMITER.wait()
+        timeout = HTTP_TIMEOUT
+        if _DEADLINE:
+            remaining = max(0.1, _DEADLINE - time.monotonic())
+            timeout = tuple(min(limit, remaining) for limit in HTTP_TIMEOUT)
+        try:
+            response = _get_session().get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            failure = f'{type(error).__name__}: {error}'
+            delay = next(delays)
+        else:
+            if response.status_code not in RETRY_HTTP_STATUS:
+                try:
+                    return response.json()
+                except ValueError as error:
+                    raise CircleCIError(
+                        f'CircleCI request {url} returned HTTP '
+                        f'{response.status_code}, not JSON') from error
+            failure = f'HTTP {response.status_code}'
+            delay = _retry_after(response)
+            if delay is None:
+                delay = next(delays)
+        if attempt + 1 < MAX_API_RETRIES:
+            _check_deadline(delay)
+            time.sleep(delay)
+    raise CircleCIError(f'CircleCI request {url} failed {MAX_API_RETRIES} '
+                        f'times, last with {failure}')
+
 
 def _find_commit_in_cci_pipeline_object(response: dict,
                                         commit_ref: str) -> dict:
@@ -45,67 +218,311 @@ def _find_commit_in_cci_pipeline_object(response: dict,
     return None
 
 
+def _load_pipeline_index(path: str) -> dict:
+    """Load the commit -> pipeline index from disk, or start a new one. The
+    index looks like {project_slug: {branch: {'newest': number, 'searched':
+    bool, 'pipelines': {revision: {'id': ..., 'number': ...}}}}}."""
+    try:
+        with open(path, encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_pipeline_index(path: str, index: dict) -> None:
+    """Atomically write the commit -> pipeline index to disk, keeping only
+    the newest INDEX_MAX_PIPELINES pipelines per project/branch."""
+    for branches in index.values():
+        for branch_index in branches.values():
+            pipelines = branch_index['pipelines']
+            if len(pipelines) > INDEX_MAX_PIPELINES:
+                newest = sorted(pipelines.items(),
+                                key=lambda item: item[1]['number'])
+                branch_index['pipelines'] = dict(newest[-INDEX_MAX_PIPELINES:])
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.{os.getpid()}', 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    os.replace(f'{path}.{os.getpid()}', path)
+
+
+def _created_before(item: dict, max_age: float) -> bool:
+    """Return True if a CCI pipeline object is older than max_age days."""
+    created_at = datetime.datetime.fromisoformat(
+        item['created_at'].replace('Z', '+00:00'))
+    age = datetime.datetime.now(datetime.timezone.utc) - created_at
+    return age > datetime.timedelta(days=max_age)
+
+
 def _get_pipeline_from_commit(project_slug: str, branch: str,
-                             commit_ref: str) -> dict:
-    """Loop though all the CircleCI pipelines for a given project/branch, returning
-    the id & number of the CircleCI pipeline matching a specific commit. There
-    should be only one pipeline per git commit."""
+                             commit_ref: str, index: dict = None,
+                             max_pages: int = 0, max_age: float = 0) -> dict:
+    """Loop though the CircleCI pipelines for a given project/branch, newest
+    first, returning the id & number of the CircleCI pipeline matching a
+    specific commit. There should be only one pipeline per git commit.
+
+    If a branch index (see _load_pipeline_index()) is given, known commits
+    are answered without any API calls, and every pipeline we page through
+    is added to it. The search stops after max_pages pages, at pipelines
+    older than max_age days (0 means no limit), or at the end of the branch
+    history. When a search stops there without finding the commit, the
+    index records the newest pipeline it started from as 'newest': later
+    searches stop as soon as they reach it, since everything from there down
+    to where that search stopped is already known. So a miss on a warm index
+    only pages through the pipelines created since the last miss."""
+    if index is None:
+        index = {}
+    pipelines = index.setdefault('pipelines', {})
+    if commit_ref in pipelines:
+        return pipelines[commit_ref]
+    known_newest = index.get('newest') if index.get('searched') else None
+    newest = None
 
     url = f'{CIRCLE_API_ENDPOINT}/project/{project_slug}/pipeline'
     query_string = {'branch': branch}
-    headers = {'Circle-Token': os.environ['CIRCLE_API_TOKEN']}
 
+    pages = 0
     next_page_token = "first_loop"
     while next_page_token:
         if next_page_token and next_page_token != "first_loop":
             query_string['page-token'] = next_page_token
 
         # Make an API call
-        response = requests.get(url, headers=headers, params=query_string)
-        json_response = response.json()
+        json_response = _api_get(url, params=query_string)
+        pages += 1
 
         # If the 'items' key exists, we know the API call was successful
         if 'items' in json_response.keys():
             next_page_token = json_response['next_page_token']
+            caught_up = False
+            for item in json_response['items']:
+                if newest is None:
+                    newest = item['number']
+                caught_up = caught_up or (known_newest is not None
+                                          and item['number'] <= known_newest)
+                pipelines.setdefault(item['vcs']['revision'],
+                                     {'id': item['id'],
+                                      'number': item['number']})
             pipeline_metadata = _find_commit_in_cci_pipeline_object(
                 json_response, commit_ref)
             if pipeline_metadata:
-                return pipeline_metadata
+                # Pipelines between here and any earlier search's 'newest'
+                # haven't been seen, so the index stays as it was.
+                return pipelines[commit_ref]
+            if (caught_up or not next_page_token
+                    or (max_pages and pages >= max_pages)
+                    or (max_age and json_response['items']
+                        and _created_before(json_response['items'][-1],
+                                            max_age))):
+                if newest is not None:
+                    index['newest'] = newest
+                    index['searched'] = True
+                return None
         # If the 'items' key doesn't exist, there was an error in the API call
         else:
-            sys.exit(f'ERROR: CircleCI says: {json_response}')
-        # time.sleep(1) # don't get throttled by the CCI API server
+            raise CircleCIError(f'CircleCI says: {json_response}')
+    return None
 
 
 def _get_pipeline_workflows(pipeline_id: str) -> dict:
     """Get all workflows in a CCI pipeline"""
     url = f'{CIRCLE_API_ENDPOINT}/pipeline/{pipeline_id}/workflow'
-    headers = {'Circle-Token': os.environ['CIRCLE_API_TOKEN']}
 
     # Make an API call
-    response = requests.get(url, headers=headers)
-    return response.json()
+    return _api_get(url)
+
+
+def _get_workflow_jobs(workflow_id: str) -> list:
+    """Get all jobs in a CCI workflow"""
+    url = f'{CIRCLE_API_ENDPOINT}/workflow/{workflow_id}/job'
+    query_string = {}
+    jobs = []
+    while True:
+        json_response = _api_get(url, params=query_string)
+        jobs.extend(json_response.get('items', []))
+        if not json_response.get('next_page_token'):
+            return jobs
+        query_string['page-token'] = json_response['next_page_token']
+
+
+def _running_workflow_ids(workflows: dict) -> list:
+    """Return the ids of the running (or failing) workflows, whose jobs can
+    still change. Finished workflows, and workflows on hold waiting for
+    approval, are not refetched by --fail-fast."""
+    return [item['id'] for item in workflows['items']
+            if item['status'] in CIRCLE_RUNNING_STATUS]
+
+
+def _failed_jobs(pipeline_url: str, workflow_id: str, jobs: list) -> list:
+    """Return a "name url" string for every failed job in a workflow."""
+    return [f'{job["name"]} {pipeline_url}/workflows/{workflow_id}/jobs/'
+            f'{job.get("job_number", "")}'
+            for job in jobs if job['status'] in CIRCLE_JOB_FAILURE_STATUS]
+
+
+def _failed_workflow_ids(workflows: dict) -> list:
+    """Return the ids of all failed workflows in a CCI '/workflow' API
+    response object."""
+    return [item['id'] for item in workflows['items']
+            if item['status'] in CIRCLE_FAILURE_STATUS]
+
+
+def _workflows_waiting(workflows: dict) -> bool:
+    """Return True if any workflow in a CCI '/workflow' API response object
+    is still running or on hold."""
+    return any(item['status'] in CIRCLE_WAITING_STATUS
+               for item in workflows['items'])
+
+
+def _read_targets(path: str) -> list:
+    """Return a list of (project_slug, branch, commit) tuples from a file
+    (or - for stdin) of "vcs/org/project branch commit" lines."""
+    with (sys.stdin if path == '-' else open(path, encoding='utf-8')) as targets_file:
+        targets = [tuple(line.split()) for line in targets_file
+                   if line.strip() and not line.startswith('#')]
+    for target in targets:
+        if len(target) != 3 or target[0].count('/') != 2:
+            sys.exit(f'ERROR: Expecting "vcs/org/project branch commit", '
+                     f'got: {" ".join(target)}')
+    return targets
+
+
+async def _watch_target(project_slug: str, branch: str, commit: str,
+                        index: dict, index_lock: asyncio.Lock, args,
+                        deadline: float) -> bool:
+    """Find and wait for the pipeline of one --targets entry, print its
+    result, and return True if it succeeded. The blocking API calls run in
+    worker threads, sharing the session and rate limiter. A CircleCIError
+    fails this target only, so the other targets carry on."""
+    try:
+        async with index_lock:
+            pipeline = await asyncio.to_thread(
+                _get_pipeline_from_commit, project_slug, branch, commit,
+                index, int(args['--max-pages']), float(args['--max-age']))
+        if not pipeline:
+            print(f'{project_slug} {branch} {commit}: ERROR: Could not find '
+                  f'commit', flush=True)
+            return False
+
+        pipeline_url = f'https://app.circleci.com/pipelines/{project_slug}/{pipeline["number"]}'
+        delays = _backoff_delays(float(args['--min-poll']),
+                                 float(args['--max-poll']))
+        while True:
+            workflows = await asyncio.to_thread(_get_pipeline_workflows,
+                                                pipeline['id'])
+            if not _workflows_waiting(workflows):
+                break
+            if args['--fail-fast']:
+                workflow_ids = _running_workflow_ids(workflows)
+                workflow_jobs = await asyncio.gather(*[
+                    asyncio.to_thread(_get_workflow_jobs, workflow_id)
+                    for workflow_id in workflow_ids])
+                failed_jobs = [job for workflow_id, jobs
+                               in zip(workflow_ids, workflow_jobs)
+                               for job in _failed_jobs(pipeline_url,
+                                                       workflow_id, jobs)]
+                if failed_jobs:
+                    print(f'{project_slug} {branch} {commit}: failed '
+                          f'{pipeline_url} {failed_jobs}', flush=True)
+                    return False
+                failed_workflow_ids = _failed_workflow_ids(workflows)
+                if failed_workflow_ids:
+                    print(f'{project_slug} {branch} {commit}: failed '
+                          f'{pipeline_url} {failed_workflow_ids}', flush=True)
+                    return False
+            delay = next(delays)
+            if deadline and time.monotonic() + delay > deadline:
+                print(f'{project_slug} {branch} {commit}: ERROR: Timed out '
+                      f'{pipeline_url}', flush=True)
+                return False
+            await asyncio.sleep(delay)
+    except CircleCIError as error:
+        print(f'{project_slug} {branch} {commit}: ERROR: {error}', flush=True)
+        return False
+
+    failed_workflow_ids = _failed_workflow_ids(workflows)
+    if failed_workflow_ids:
+        print(f'{project_slug} {branch} {commit}: failed {pipeline_url} '
+              f'{failed_workflow_ids}', flush=True)
+        return False
+    print(f'{project_slug} {branch} {commit}: success {pipeline_url}',
+          flush=True)
+    return True
+
+
+async def _watch_targets(targets: list, index: dict, args,
+                         deadline: float) -> list:
+    """Watch all targets concurrently, returning a success flag per target.
+    Lookups for the same project/branch take turns, since they share a
+    branch index."""
+    index_locks = {}
+    watchers = []
+    for project_slug, branch, commit in targets:
+        branch_index = index.setdefault(project_slug, {}).setdefault(branch, {})
+        index_lock = index_locks.setdefault((project_slug, branch),
+                                            asyncio.Lock())
+        watchers.append(_watch_target(project_slug, branch, commit,
+                                      branch_index, index_lock, args,
+                                      deadline))
+    return await asyncio.gather(*watchers)
+
+
+def main_targets(args):
+    """Watch every --targets pipeline concurrently and exit with a combined
+    status."""
+    global _RATE_LIMITER, _DEADLINE  # pylint: disable=global-statement
+    _RATE_LIMITER = _RateLimiter(float(args['--rate']))
+
+    targets = _read_targets(args['--targets'])
+    timeout = float(args['--timeout'])
+    deadline = time.monotonic() + timeout if timeout else None
+    _DEADLINE = deadline
+    index_path = os.path.expanduser(args['--index'])
+    index = _load_pipeline_index(index_path)
+
+    try:
+        results = asyncio.run(_watch_targets(targets, index, args, deadline))
+    finally:
+        _save_pipeline_index(index_path, index)
+    if not all(results):
+        sys.exit(f'{results.count(False)} of {len(results)} pipelines did '
+                 f'not succeed')
 
 
 def main(args):
     """Find pipeline, find workflow(s), check workflow status, exit with
     appropriate status & message."""
+    global _DEADLINE  # pylint: disable=global-statement
 
     branch = args['--branch']
     commit = args['--commit']
     vcs = args['--vcs']
     org = args['--org']
     project = args['--project']
+    timeout = float(args['--timeout'])
+    deadline = time.monotonic() + timeout if timeout else None
+    _DEADLINE = deadline
 
     # The "project_slug" in part of the API's URL. (This is a CCI term.)
     project_slug = f'{vcs}/{org}/{project}'
 
-    # Find the CCI pipeline for this commit
-    pipeline = _get_pipeline_from_commit(
-        project_slug=project_slug,
-        branch=branch,
-        commit_ref=commit,
-    )
+    # Find the CCI pipeline for this commit, remembering every pipeline we
+    # see along the way in the local index.
+    index_path = os.path.expanduser(args['--index'])
+    index = _load_pipeline_index(index_path)
+    try:
+        pipeline = _get_pipeline_from_commit(
+            project_slug=project_slug,
+            branch=branch,
+            commit_ref=commit,
+            index=index.setdefault(project_slug, {}).setdefault(branch, {}),
+            max_pages=int(args['--max-pages']),
+            max_age=float(args['--max-age']),
+        )
+    except CircleCIError as error:
+        sys.exit(f'ERROR: {error}')
+    finally:
+        _save_pipeline_index(index_path, index)
     if not pipeline:
         sys.exit(f'ERROR: Could not find commit {commit} in project '
                  f'{project_slug} on branch {branch}')
@@ -116,22 +533,55 @@ def main(args):
     print(f'Waiting for "{project}" pipeline to complete.\n\n'
           f'{pipeline_url}\n\n')
 
-    # Wait for all workflows in the pipeline to complete. We use set
-    # intersection to check status against known CCI status messages.
-    status = ["running"]
-    while CIRCLE_WAITING_STATUS & set(status):
-        workflows = _get_pipeline_workflows(pipeline['id'])
-        status = [item['status'] for item in workflows['items']]
-        time.sleep(1)  # avoid CCI throttling
+    # Wait for all workflows in the pipeline to complete, checking status
+    # against known CCI status messages. Poll quickly at first, backing off
+    # toward --max-poll to avoid CCI throttling.
+    delays = _backoff_delays(float(args['--min-poll']),
+                             float(args['--max-poll']))
+    # With --fail-fast, the jobs of every running workflow are fetched in
+    # parallel on each poll, and we stop at the first failed job, or as soon
+    # as any workflow has failed while others are still running.
+    job_fetcher = (concurrent.futures.ThreadPoolExecutor(max_workers=8)
+                   if args['--fail-fast'] else contextlib.nullcontext())
+    try:
+        with job_fetcher:
+            while True:
+                workflows = _get_pipeline_workflows(pipeline['id'])
+                if not _workflows_waiting(workflows):
+                    break
+                if args['--fail-fast']:
+                    workflow_ids = _running_workflow_ids(workflows)
+                    workflow_jobs = job_fetcher.map(_get_workflow_jobs,
+                                                    workflow_ids)
+                    failed_jobs = [job for workflow_id, jobs
+                                   in zip(workflow_ids, workflow_jobs)
+                                   for job in _failed_jobs(pipeline_url,
+                                                           workflow_id, jobs)]
+                    if failed_jobs:
+                        sys.exit(f'The following jobs failed: {failed_jobs}')
+                    failed_workflow_ids = _failed_workflow_ids(workflows)
+                    if failed_workflow_ids:
+                        sys.exit(f'The following workflows failed: '
+                                 f'{failed_workflow_ids}')
+                delay = next(delays)
+                if deadline and time.monotonic() + delay > deadline:
+                    sys.exit(f'ERROR: Timed out after {timeout:g} seconds '
+                             f'waiting for pipeline {pipeline_url}')
+                time.sleep(delay)
+    except CircleCIError as error:
+        sys.exit(f'ERROR: {error}')
 
     # Now that all workflows are complete, check for failures
-    if CIRCLE_FAILURE_STATUS & set(status):
-        failed_workflow_ids = [item['id'] for item in workflows['items']
-                               if item['status'] in CIRCLE_FAILURE_STATUS]
+    failed_workflow_ids = _failed_workflow_ids(workflows)
+    if failed_workflow_ids:
         sys.exit(f'The following workflows failed: {failed_workflow_ids}')
 
 
 if __name__ == '__main__':
     if not 'CIRCLE_API_TOKEN' in os.environ:
         sys.exit('Please set environment variable CIRCLE_API_TOKEN')
-    main(docopt.docopt(__doc__))
+    arguments = docopt.docopt(__doc__)
+    if arguments['--targets']:
+        main_targets(arguments)
+    else:
+        main(arguments)
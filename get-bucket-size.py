@@ -2,13 +2,25 @@
 #
 # Return the size of all S3 buckets in a given AWS account.
 
+import argparse
 import boto3
 import botocore
+import concurrent.futures
 import datetime
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
 
+import aws_inventory
 
-# An immutable list of S3 storage types, as referenced in CloudWatch Metrics by the `StorageType` dimension.
-CLOUDWATCH_STORAGE_TYPESk = (
+
+# An immutable list of S3 storage types, as referenced in CloudWatch Metrics by the `StorageType` dimension. This is only
+# a fallback for when we don't know which storage types a bucket has; see list_bucket_storage_types().
+CLOUDWATCH_STORAGE_TYPES = (
     "DeepArchiveObjectOverhead",
     "DeepArchiveS3ObjectOverhead",
     "DeepArchiveStorage",
@@ -22,34 +34,162 @@ CLOUDWATCH_STORAGE_TYPESk = (
 )
 
 
-# TODO: This is incredibly slow due to all the different dimensions we need to pull to get a complete picture of S3
-# bucket size. Would be great if we could return all AWS/S3 BucketSizeBytes metrics at once, and parse the JSON.
-def get_bucket_size(bucket_name, region):
+# How long each kind of cached bucket metadata stays fresh, in seconds. Bucket regions almost never change, and
+# BucketSizeBytes is only published once a day.
+CACHE_TTL_REGION = 30 * 86400
+CACHE_TTL_STORAGE_TYPES = 86400
+CACHE_TTL_SIZE = 86400
+
+# One CloudWatch client per region, shared by all worker threads. (Clients are thread safe, creating them is not.)
+_cloudwatch_clients = {}
+_cloudwatch_clients_lock = threading.Lock()
+
+
+def get_cloudwatch_client(region):
+  """Return the cached CloudWatch client for the given region, creating it on first use"""
+  with _cloudwatch_clients_lock:
+    if region not in _cloudwatch_clients:
+      _cloudwatch_clients[region] = boto3.client('cloudwatch', region_name=region, config=aws_inventory.BOTO_CONFIG)
+    return _cloudwatch_clients[region]
+
+
+def get_metric_window():
+  """Return (start, end) datetimes of the daily BucketSizeBytes datapoint we report on"""
+  # For some reason, CloudWatch metrics are > 24 hours behind.
+  today = datetime.datetime.today()
+  return today - datetime.timedelta(days=3), today - datetime.timedelta(days=2)
+
+
+class BucketCache:
+  """On-disk SQLite cache of bucket region, storage types and daily size, keyed by account + bucket.
+
+  Each kind of data expires separately (see the CACHE_TTL_* constants). Sizes are also keyed by the day of the
+  datapoint, so a new day's report always fetches fresh sizes. Only use a cache from the thread that created it.
+  """
+
+  def __init__(self, path, account):
+    self.account = account
+    self.db = sqlite3.connect(path)
+    with self.db:
+      self.db.execute('CREATE TABLE IF NOT EXISTS bucket_region '
+                      '(account TEXT, bucket TEXT, region TEXT, updated REAL, PRIMARY KEY (account, bucket))')
+      self.db.execute('CREATE TABLE IF NOT EXISTS bucket_storage_types '
+                      '(account TEXT, bucket TEXT, storage_types TEXT, updated REAL, PRIMARY KEY (account, bucket))')
+      self.db.execute('CREATE TABLE IF NOT EXISTS bucket_size '
+                      '(account TEXT, bucket TEXT, day TEXT, size REAL, updated REAL, PRIMARY KEY (account, bucket, day))')
+
+  def _get(self, query, params, bucket_names):
+    """Return dict of bucket name -> value for the rows of the given query matching one of bucket_names"""
+    wanted = set(bucket_names)
+    return {bucket: value for bucket, value in self.db.execute(query, params) if bucket in wanted}
+
+  def get_regions(self, bucket_names):
+    """Return dict of bucket name -> region for buckets with a fresh cached region"""
+    return self._get('SELECT bucket, region FROM bucket_region WHERE account = ? AND updated > ?',
+                     (self.account, time.time() - CACHE_TTL_REGION), bucket_names)
+
+  def put_regions(self, regions):
+    """Cache the given dict of bucket name -> region"""
+    with self.db:
+      self.db.executemany('INSERT OR REPLACE INTO bucket_region VALUES (?, ?, ?, ?)',
+                          [(self.account, bucket, region, time.time()) for bucket, region in regions.items()])
+
+  def get_storage_types(self, bucket_names):
+    """Return dict of bucket name -> set of storage types for buckets with fresh cached storage types"""
+    rows = self._get('SELECT bucket, storage_types FROM bucket_storage_types WHERE account = ? AND updated > ?',
+                     (self.account, time.time() - CACHE_TTL_STORAGE_TYPES), bucket_names)
+    return {bucket: set(json.loads(storage_types)) for bucket, storage_types in rows.items()}
+
+  def put_storage_types(self, storage_types):
+    """Cache the given dict of bucket name -> set of storage types"""
+    with self.db:
+      self.db.executemany('INSERT OR REPLACE INTO bucket_storage_types VALUES (?, ?, ?, ?)',
+                          [(self.account, bucket, json.dumps(sorted(types)), time.time())
+                           for bucket, types in storage_types.items()])
+
+  def get_sizes(self, bucket_names, day):
+    """Return dict of bucket name -> size for buckets with a fresh cached size for the given day"""
+    return self._get('SELECT bucket, size FROM bucket_size WHERE account = ? AND day = ? AND updated > ?',
+                     (self.account, day, time.time() - CACHE_TTL_SIZE), bucket_names)
+
+  def put_sizes(self, sizes, day):
+    """Cache the given dict of bucket name -> size for the given day"""
+    with self.db:
+      self.db.executemany('INSERT OR REPLACE INTO bucket_size VALUES (?, ?, ?, ?, ?)',
+                          [(self.account, bucket, day, size, time.time()) for bucket, size in sizes.items()])
+
+
+def list_bucket_storage_types(region):
+  """Return dict of bucket name -> set of storage types that have a BucketSizeBytes metric in the given region.
+
+  One paginated ListMetrics sweep per region tells us exactly which series exist, including storage types missing from
+  CLOUDWATCH_STORAGE_TYPES (e.g. IntelligentTiering*).
+  """
+  cloudwatch = get_cloudwatch_client(region)
+  storage_types = {}
+  paginator = cloudwatch.get_paginator('list_metrics')
+  for page in paginator.paginate(Namespace='AWS/S3', MetricName='BucketSizeBytes'):
+    for metric in page['Metrics']:
+      dimensions = {dimension['Name']: dimension['Value'] for dimension in metric['Dimensions']}
+      if 'BucketName' in dimensions and 'StorageType' in dimensions:
+        storage_types.setdefault(dimensions['BucketName'], set()).add(dimensions['StorageType'])
+  return storage_types
+
+
+def get_bucket_sizes(bucket_names, region, storage_types=None):
+  """Return dict of bucket name -> size for the given S3 buckets, all of which must live in the given region.
+
+  If storage_types (as returned by list_bucket_storage_types()) is given, only the series that actually exist are
+  queried. Otherwise every bucket is queried for all CLOUDWATCH_STORAGE_TYPES.
+
+  Rather than one get_metric_statistics call per bucket and storage type, every BucketSizeBytes series is batched
+  into GetMetricData requests of up to 500 queries each, so a region costs dozens of API calls instead of thousands.
+  """
+  cloudwatch = get_cloudwatch_client(region)
+  sizes = {bucket_name: 0 for bucket_name in bucket_names}
+
+  # Query ids must start with a lowercase letter, so keep our own id -> bucket name mapping.
+  queries = []
+  query_buckets = {}
+  for bucket_name in sizes:
+    bucket_storage_types = storage_types.get(bucket_name, ()) if storage_types is not None else CLOUDWATCH_STORAGE_TYPES
+    for storage_type in sorted(bucket_storage_types):
+      query_id = 'q{}'.format(len(queries))
+      query_buckets[query_id] = bucket_name
+      queries.append({
+          'Id': query_id,
+          'MetricStat': {
+              'Metric': {
+                  'Namespace': 'AWS/S3',
+                  'MetricName': 'BucketSizeBytes',
+                  'Dimensions': [
+                      {
+                          'Name': 'BucketName',
+                          'Value': bucket_name,
+                      },
+                      {
+                          'Name': 'StorageType',
+                          'Value': storage_type,
+                      }
+                  ],
+              },
+              'Period': 86400,
+              'Stat': 'Average',
+          },
+          'ReturnData': True,
+      })
+
+  start_time, end_time = get_metric_window()
+  for query_id, values in aws_inventory.get_metric_data(cloudwatch, queries, start_time, end_time).items():
+    # Only count the first datapoint of each series.
+    if values:
+      sizes[query_buckets[query_id]] += values[0]
+  return sizes
+
+
+def get_bucket_size(bucket_name, region, storage_types=None):
   """Return size of specified S3 bucket"""
-  cloudwatch = boto3.client('cloudwatch', region_name=region)
-  total_size = 0
-  for storage_type in CLOUDWATCH_STORAGE_TYPES:
-    response = cloudwatch.get_metric_statistics(
-        Namespace='AWS/S3',
-        MetricName='BucketSizeBytes',
-        Dimensions=[
-            {
-                'Name': 'BucketName',
-                'Value': bucket_name,
-            },
-            {
-                'Name': 'StorageType',
-                'Value': storage_type,
-            }
-        ],
-        # For some reason, CloudWatch metrics are > 24 hours behind.
-        StartTime=datetime.datetime.today() - datetime.timedelta(days=3),
-        EndTime=datetime.datetime.today() - datetime.timedelta(days=2),
-        Period=86400,
-        Statistics=['Average'],
-    )
-    total_size += response['Datapoints'][0]['Average'] if response['Datapoints'] else 0
-  return total_size
+  return get_bucket_sizes([bucket_name], region, storage_types)[bucket_name]
 
 
 def list_all_buckets(s3_client):
@@ -64,30 +204,156 @@ def get_bucket_region(s3_client, bucket_name):
   return response['LocationConstraint'] if response['LocationConstraint'] else 'us-east-1'
 
 
-if __name__ == "__main__":
-  s3_client = boto3.client('s3')
-  buckets = {}
-  for bucket in list_all_buckets(s3_client):
-    bucket_name = bucket['Name']
-    # skip restricted bucket
-    if bucket_name == 'meetgroup-data':
-      continue
-
-    # get region
+def get_bucket_regions(s3_client, bucket_names, workers):
+  """Return dict of bucket name -> region, looked up concurrently. Buckets which no longer exist map to None."""
+  def lookup(bucket_name):
     try:
-      region = get_bucket_region(s3_client, bucket_name)
+      return get_bucket_region(s3_client, bucket_name)
     except botocore.exceptions.ClientError as err:
-      # If the bucket doesn't exist, set size to -1 and continue. This way, our output still contains a complete list of buckets.
       if err.response['Error']['Code'] == 'NoSuchBucket':
-        buckets[bucket_name] = -1
-        continue
-      else:
-        raise err
-
-    # get bucket size
-    buckets[bucket_name] = get_bucket_size(bucket_name, region)
-
-  # sort buckets by size and print with size in first column
-  sorted_buckets = sorted([(v, k) for k, v in buckets.items()])
-  for size, bucket in sorted_buckets:
-    print('{}\t{}'.format(size, bucket))
+        return None
+      raise err
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    return dict(zip(bucket_names, executor.map(lookup, bucket_names)))
+
+
+def get_region_bucket_sizes(region, bucket_names, storage_types=None):
+  """Return (storage types, sizes) dicts keyed by bucket name for the given buckets in a single region. Storage types
+  are discovered with list_bucket_storage_types() unless they are given."""
+  if storage_types is None:
+    storage_types = list_bucket_storage_types(region)
+  return storage_types, get_bucket_sizes(bucket_names, region, storage_types)
+
+
+class SortedReport:
+  """Collect every bucket and print them all sorted by size, with size in the first column, once the crawl is done."""
+
+  def __init__(self):
+    self.buckets = []
+
+  def add(self, bucket_name, size, region):
+    self.buckets.append((size, bucket_name))
+
+  def region_done(self, region):
+    pass
+
+  def finish(self):
+    for size, bucket in sorted(self.buckets):
+      print('{}\t{}'.format(size, bucket))
+
+
+class TopReport(SortedReport):
+  """Keep only the N largest buckets in a bounded heap. The current top N is written to stderr as each region
+  completes, and the final top N is printed in the same format as SortedReport."""
+
+  def __init__(self, n):
+    super().__init__()
+    self.n = n
+
+  def add(self, bucket_name, size, region):
+    if len(self.buckets) < self.n:
+      heapq.heappush(self.buckets, (size, bucket_name))
+    else:
+      heapq.heappushpop(self.buckets, (size, bucket_name))
+
+  def region_done(self, region):
+    print('# top {} after {}: {}'.format(
+        self.n, region, ', '.join('{}={}'.format(bucket, size) for size, bucket in sorted(self.buckets, reverse=True))),
+        file=sys.stderr)
+
+
+class StreamReport(SortedReport):
+  """Print each bucket as a JSON line as soon as its size is known, holding nothing in memory."""
+
+  def add(self, bucket_name, size, region):
+    print(json.dumps({'bucket': bucket_name, 'size': size, 'region': region}), flush=True)
+
+  def finish(self):
+    pass
+
+
+def positive_int(text):
+  """argparse type for a whole number of at least 1"""
+  value = int(text)
+  if value < 1:
+    raise argparse.ArgumentTypeError('must be at least 1, got {}'.format(value))
+  return value
+
+
+def main(args):
+  """Collect the size of every bucket, answering from the cache where we can, and report them."""
+  if args.stream:
+    report = StreamReport()
+  elif args.top is not None:
+    report = TopReport(args.top)
+  else:
+    report = SortedReport()
+
+  s3_client = boto3.client('s3', config=aws_inventory.BOTO_CONFIG)
+  # skip restricted bucket
+  bucket_names = [bucket['Name'] for bucket in list_all_buckets(s3_client) if bucket['Name'] != 'meetgroup-data']
+
+  cache = None
+  if not args.no_cache:
+    account = boto3.client('sts', config=aws_inventory.BOTO_CONFIG).get_caller_identity()['Account']
+    cache_path = os.path.expanduser(args.cache)
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    cache = BucketCache(cache_path, account)
+  day = get_metric_window()[0].date().isoformat()
+
+  # get regions (cached ones first), grouping buckets by region
+  bucket_regions = cache.get_regions(bucket_names) if cache else {}
+  missing = [bucket_name for bucket_name in bucket_names if bucket_name not in bucket_regions]
+  looked_up = get_bucket_regions(s3_client, missing, args.workers)
+  if cache:
+    cache.put_regions({bucket_name: region for bucket_name, region in looked_up.items() if region})
+  bucket_regions.update(looked_up)
+
+  cached_sizes = cache.get_sizes(bucket_names, day) if cache else {}
+  regions = {}
+  for bucket_name, region in bucket_regions.items():
+    # If the bucket doesn't exist, set size to -1. This way, our output still contains a complete list of buckets.
+    if region is None:
+      report.add(bucket_name, -1, region)
+    elif bucket_name in cached_sizes:
+      report.add(bucket_name, cached_sizes[bucket_name], region)
+    else:
+      regions.setdefault(region, []).append(bucket_name)
+
+  # discover which storage types each bucket has (unless they're all cached), then get bucket sizes with one batch of
+  # GetMetricData calls per region. Regions are processed concurrently and reported as they complete.
+  with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+    futures = {}
+    for region, names in regions.items():
+      storage_types = cache.get_storage_types(names) if cache else {}
+      if len(storage_types) < len(names):
+        storage_types = None
+      future = executor.submit(get_region_bucket_sizes, region, names, storage_types)
+      futures[future] = (region, names, storage_types is None)
+    for future in concurrent.futures.as_completed(futures):
+      region, names, discovered = futures.pop(future)
+      storage_types, sizes = future.result()
+      if cache:
+        # Only cache storage types we just discovered, so refreshing sizes doesn't keep cached ones from expiring.
+        if discovered:
+          cache.put_storage_types({bucket_name: storage_types.get(bucket_name, set()) for bucket_name in names})
+        cache.put_sizes(sizes, day)
+      for bucket_name, size in sizes.items():
+        report.add(bucket_name, size, region)
+      report.region_done(region)
+
+  report.finish()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Return the size of all S3 buckets in a given AWS account.')
+  parser.add_argument('--workers', type=int, default=8,
+                      help='number of concurrent bucket/region lookups (default: %(default)s)')
+  parser.add_argument('--cache', default='~/.cache/get-bucket-size.sqlite',
+                      help='SQLite file caching bucket regions, storage types and sizes (default: %(default)s)')
+  parser.add_argument('--no-cache', action='store_true', help='ignore the cache and fetch everything')
+  output = parser.add_mutually_exclusive_group()
+  output.add_argument('--top', type=positive_int, metavar='N', help='only report the N largest buckets')
+  output.add_argument('--stream', action='store_true', help='print each bucket as a JSON line as soon as it is known')
+  main(parser.parse_args())
@@ -2,48 +2,93 @@
 """Print summary of all EC2 instances along with their total EBS disk size allocation. Indented under each EC2
 instance, print each EBS volume including size and type."""
 
-import boto3
-from pprint import pprint
+import argparse
+import functools
+import itertools
 
+import aws_inventory
 
-def get_ec2_reservations(region):
-  """Return dictionary of EC2 instances from the given region."""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_instances()
-  return response['Reservations']
 
+# Number of instances whose volumes are looked up together.
+INSTANCE_BATCH_SIZE = 200
 
-def get_ebs_volumes(region):
-  """Return a dictionary of all AWS EBS volumes in the given region"""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_volumes()
-  return response['Volumes']
+
+def parse_filter(text):
+  """Turn 'Name=Value1,Value2' into an EC2 API filter, e.g. 'tag:Env=prod' or 'volume-type=gp2,gp3'."""
+  name, _, values = text.partition('=')
+  return {'Name': name, 'Values': values.split(',')}
+
+
+def get_ec2_reservations(ec2, filters=None):
+  """Yield EC2 reservations, one page of describe_instances at a time, matching the given filters."""
+  paginator = ec2.get_paginator('describe_instances')
+  for page in paginator.paginate(Filters=filters or []):
+    yield from page['Reservations']
+
+
+def get_ec2_instances(ec2, filters=None):
+  """Yield EC2 instances matching the given filters."""
+  for reservation in get_ec2_reservations(ec2, filters):
+    yield from reservation['Instances']
+
+
+class VolumeIndex:
+  """Lookup of EBS volumes by VolumeId, filled lazily with batched describe_volumes calls for only the volumes we ask
+  for. Volumes which don't exist (or don't match the given filters) are simply missing from the index."""
+
+  def __init__(self, ec2, filters=None):
+    self.ec2 = ec2
+    self.filters = filters or []
+    self.volumes = {}
+    self.fetched = set()
+
+  def load(self, volume_ids):
+    """Fetch any of the given volumes we haven't looked up yet."""
+    wanted = {volume_id for volume_id in volume_ids if volume_id not in self.fetched}
+    # A volume deleted since we listed its instance is just missing, rather than failing with InvalidVolume.NotFound.
+    for volume in aws_inventory.describe_by_id(self.ec2, 'describe_volumes', 'Volumes', 'volume-id', wanted,
+                                               self.filters):
+      self.volumes[volume['VolumeId']] = volume
+    self.fetched.update(wanted)
+
+  def get(self, volume_id):
+    """Return the volume with the given VolumeId, or None."""
+    self.load([volume_id])
+    return self.volumes.get(volume_id)
+
+
+def get_instance_volume_ids(instance):
+  """Return the VolumeIds of all EBS volumes attached to the given instance."""
+  return [device['Ebs']['VolumeId'] for device in instance['BlockDeviceMappings'] if 'Ebs' in device]
+
+
+def collect(target, args):
+  """Yield a row per instance including its total EBS size, each followed by a row per EBS volume. Instances are
+  handled one batch at a time, so we only look up the volumes each batch references."""
+  ec2 = target.client('ec2')
+  volumes = VolumeIndex(ec2, args.volume_filters)
+
+  instances = get_ec2_instances(ec2, args.filters)
+  for batch in iter(lambda: list(itertools.islice(instances, INSTANCE_BATCH_SIZE)), []):
+    volumes.load(volume_id for instance in batch for volume_id in get_instance_volume_ids(instance))
+    for instance in batch:
+      instance_volumes = [volumes.get(volume_id) for volume_id in get_instance_volume_ids(instance)]
+      instance_volumes = [volume for volume in instance_volumes if volume]
+
+      # summary of total EBS size (regardless of type) along with instanceId and 'Name'
+      yield (sum(volume['Size'] for volume in instance_volumes), instance['InstanceId'],
+             [tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'])
+      # list all EBS volmes for this instance, indented under it
+      for volume in instance_volumes:
+        yield ('', volume['VolumeId'], volume['Size'], volume['VolumeType'])
 
 
 if __name__ == "__main__":
-  region = 'us-east-1'
-
-  # Create dictionary of volumes for easy lookup by VolumeId
-  volumes = {}
-  for volume in get_ebs_volumes(region=region):
-    volumes[volume['VolumeId']] = volume
-
-  # Print instances including all volume information
-  for reservation in get_ec2_reservations(region=region):
-    for instance in reservation['Instances']:
-      # add up all disk sizes regardless of type
-      total_ebs_size = 0
-      for device in instance['BlockDeviceMappings']:
-        if 'Ebs' in device:
-          volume_id = device['Ebs']['VolumeId']
-          total_ebs_size += volumes[volume_id]['Size']
-
-      # print summery of total EBS size along with instanceId and 'Name'
-      print('{}\t{}\t{}'.format(total_ebs_size, instance['InstanceId'], [
-            tag['Value'] for tag in instance['Tags'] if tag['Key'] == 'Name']))
-      # list all EBS volmes for this instance
-      for device in instance['BlockDeviceMappings']:
-        if 'Ebs' in device:
-          volume_id = device['Ebs']['VolumeId']
-          print('\t{}\t{}\t{}'.format(
-              volume_id, volumes[volume_id]['Size'], volumes[volume_id]['VolumeType']))
+  parser = argparse.ArgumentParser(description=__doc__)
+  aws_inventory.add_arguments(parser)
+  parser.add_argument('--filter', dest='filters', type=parse_filter, action='append', default=[],
+                      metavar='NAME=VALUES', help='describe_instances filter, e.g. tag:Env=prod (repeatable)')
+  parser.add_argument('--volume-filter', dest='volume_filters', type=parse_filter, action='append', default=[],
+                      metavar='NAME=VALUES', help='describe_volumes filter, e.g. volume-type=gp2 (repeatable)')
+  args = parser.parse_args()
+  aws_inventory.main(functools.partial(collect, args=args), args)
@@ -2,57 +2,92 @@
 
 """
 List all AMIs.
-List snapshots in AWS not assoicated with an AMI.
+List snapshots in AWS not assoicated with an AMI or an existing EBS volume, along with the total reclaimable GiB.
 """
 
-import boto3
-from pprint import pprint
+import argparse
+import functools
 
+import aws_inventory
 
-def get_ec2_amis(region):
-  """Return a list of AMIs in the given region."""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_images(Owners=['self'])
-  return response['Images']
 
+class SnapshotRecord:
+  """The few snapshot fields we report on. Full describe_snapshots responses (with their long Description strings)
+  are dropped as soon as each page is read."""
+  __slots__ = ('snapshot_id', 'size', 'start_time', 'volume_id')
 
-def get_ec2_snapshots(region, owner_ids):
-  """Return list of snapshots in the given region, owned by the given owner."""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_snapshots(OwnerIds=owner_ids)
-  return response['Snapshots']
+  def __init__(self, snapshot):
+    self.snapshot_id = snapshot['SnapshotId']
+    self.size = snapshot['VolumeSize']
+    self.start_time = snapshot['StartTime']
+    self.volume_id = snapshot.get('VolumeId')
 
 
-if __name__ == '__main__':
-  region = 'us-east-1'
-  owners = ['444444444444']
-
-  # Create dict of snapshots with key as SnapshotId for easy lookup
-  snapshots = {}
-  for snapshot in get_ec2_snapshots(region, owners):
-    snapshot_id = snapshot['SnapshotId']
-    snapshots[snapshot_id] = snapshot
-
-  # Create a dictionary mapping SnapshotIds to ImageIds. This allows us to easily determine which snapshots are *not*
-  # assoicated with an AMI.
-  snapshot_to_ami = {}
-  for snapshot_id in snapshots:
-    snapshot_to_ami[snapshot_id] = []
-
-  # Print a list of AMIs
-  # Append AMI ImageId to the appropriate snapshot_to_ami mapping
-  amis = get_ec2_amis(region)
-  for ami in amis:
+def get_ec2_amis(ec2):
+  """Yield AMIs owned by this account, one page of describe_images at a time."""
+  paginator = ec2.get_paginator('describe_images')
+  for page in paginator.paginate(Owners=['self']):
+    yield from page['Images']
+
+
+def get_ec2_snapshots(ec2, owner_ids):
+  """Yield a SnapshotRecord per snapshot owned by the given owner, one page of describe_snapshots at a time."""
+  paginator = ec2.get_paginator('describe_snapshots')
+  for page in paginator.paginate(OwnerIds=owner_ids):
+    for snapshot in page['Snapshots']:
+      yield SnapshotRecord(snapshot)
+
+
+def get_volume_snapshot_ids(ec2):
+  """Return the set of SnapshotIds which existing EBS volumes were created from."""
+  snapshot_ids = set()
+  paginator = ec2.get_paginator('describe_volumes')
+  for page in paginator.paginate():
+    snapshot_ids.update(volume['SnapshotId'] for volume in page['Volumes'] if volume.get('SnapshotId'))
+  return snapshot_ids
+
+
+def collect(target, args):
+  """Yield a row per AMI, then a row per orphaned snapshot, then a summary row.
+
+  Only the (small) sets of snapshot ids referenced by AMIs and by volumes are held in memory; snapshots themselves are
+  streamed a page at a time. The reclaimable size is an upper bound, since snapshots are stored incrementally.
+  """
+  ec2 = target.client('ec2')
+
+  # List AMIs, collecting the snapshots they reference
+  ami_snapshot_ids = set()
+  for ami in get_ec2_amis(ec2):
     device_size = 0
     for device in ami['BlockDeviceMappings']:
-      if 'Ebs' in device:
-        snapshot_id = device['Ebs']['SnapshotId']
-        snapshot_to_ami[snapshot_id].append(ami['ImageId'])
+      if 'Ebs' in device and 'SnapshotId' in device['Ebs']:
+        ami_snapshot_ids.add(device['Ebs']['SnapshotId'])
         device_size += device['Ebs']['VolumeSize']
-    print('{}\t{}\t{}'.format(device_size, ami['ImageId'], ami['Name']))
+    yield (device_size, ami['ImageId'], ami['Name'])
+
+  volume_snapshot_ids = get_volume_snapshot_ids(ec2)
+
+  # List all snapshots which are *not* assoicated with an AMI or in use by a volume
+  total = ami_count = in_use_count = orphan_count = reclaimable_size = 0
+  for snapshot in get_ec2_snapshots(ec2, args.owners):
+    total += 1
+    if snapshot.snapshot_id in ami_snapshot_ids:
+      ami_count += 1
+    elif snapshot.snapshot_id in volume_snapshot_ids:
+      in_use_count += 1
+    else:
+      orphan_count += 1
+      reclaimable_size += snapshot.size
+      yield (snapshot.size, snapshot.snapshot_id, snapshot.start_time.isoformat(), snapshot.volume_id)
 
-  # Print all snapshots which are *not* assoicated with an AMI
-  for snapshot_id, amis in snapshot_to_ami.items():
-    if not amis:
-      print('{}\t{}\t{}'.format(snapshots[snapshot_id]['VolumeSize'],
-            snapshots[snapshot_id]['SnapshotId'], snapshots[snapshot_id]['Description']))
+  yield ('# {} snapshots: {} referenced by AMIs, {} in use by volumes, {} orphaned, {} GiB reclaimable'.format(
+      total, ami_count, in_use_count, orphan_count, reclaimable_size),)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  aws_inventory.add_arguments(parser)
+  parser.add_argument('--owners', nargs='+', default=['self'],
+                      help='snapshot owner ids (default: %(default)s, i.e. each target account)')
+  args = parser.parse_args()
+  aws_inventory.main(functools.partial(collect, args=args), args)
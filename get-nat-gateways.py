@@ -1,59 +1,141 @@
 #!/usr/bin/env python3
 
-import boto3
+import argparse
+import datetime
+import functools
 
+import aws_inventory
 
-def get_subnets(region):
-  """Return a list of subnets in the given region."""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_subnets()
-  return response['Subnets']
 
+# NAT Gateway CloudWatch metrics pulled by the --report mode, and the statistic we want for each.
+NAT_GATEWAY_METRICS = {
+    'BytesOutToDestination': 'Sum',
+    'BytesInFromDestination': 'Sum',
+    'BytesInFromSource': 'Sum',
+    'ActiveConnectionCount': 'Maximum',
+}
 
-def get_nat_gateways(region):
-  """Return a list of NAT Gateways in the given region."""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_nat_gateways()
-  return response['NatGateways']
 
+def get_name_tag(resource):
+  """Return the value of the resource's 'Name' tag, or '' if it doesn't have one."""
+  for tag in resource.get('Tags', []):
+    if tag['Key'] == 'Name':
+      return tag['Value']
+  return ''
 
-def get_vpcs(region):
-  """Return a list of VPCs in the given region."""
-  ec2 = boto3.client('ec2', region_name=region)
-  response = ec2.describe_vpcs()
-  return response['Vpcs']
+
+def get_nat_gateways(ec2):
+  """Yield NAT Gateways, one page of describe_nat_gateways at a time."""
+  paginator = ec2.get_paginator('describe_nat_gateways')
+  for page in paginator.paginate():
+    yield from page['NatGateways']
+
+
+def get_vpcs(ec2, vpc_ids):
+  """Yield the VPCs with the given ids."""
+  return aws_inventory.describe_by_id(ec2, 'describe_vpcs', 'Vpcs', 'vpc-id', vpc_ids)
+
+
+def get_subnets(ec2, subnet_ids):
+  """Yield the subnets with the given ids."""
+  return aws_inventory.describe_by_id(ec2, 'describe_subnets', 'Subnets', 'subnet-id', subnet_ids)
+
+
+def get_name_index(ec2, gateways):
+  """Return dict of VPC/subnet id -> 'Name' tag for the VPCs and subnets the given NAT Gateways live in."""
+  names = {}
+  for vpc in get_vpcs(ec2, {gateway['VpcId'] for gateway in gateways}):
+    names[vpc['VpcId']] = get_name_tag(vpc)
+  for subnet in get_subnets(ec2, {gateway['SubnetId'] for gateway in gateways}):
+    names[subnet['SubnetId']] = get_name_tag(subnet)
+  return names
+
+
+def get_nat_gateway_metrics(cloudwatch, gateway_ids, days):
+  """Return dict of NAT Gateway id -> dict of metric name -> value over the last given number of days.
+
+  Every (gateway, metric) series is fetched in as few GetMetricData requests as possible, with a single period covering
+  the whole window. Sums are added up and maximums maxed, in case CloudWatch splits the window into two datapoints.
+  """
+  end_time = datetime.datetime.now(datetime.timezone.utc)
+  start_time = end_time - datetime.timedelta(days=days)
+
+  queries = []
+  query_series = {}
+  for gateway_id in gateway_ids:
+    for metric_name, stat in NAT_GATEWAY_METRICS.items():
+      query_id = 'q{}'.format(len(queries))
+      query_series[query_id] = (gateway_id, metric_name, stat)
+      queries.append({
+          'Id': query_id,
+          'MetricStat': {
+              'Metric': {
+                  'Namespace': 'AWS/NATGateway',
+                  'MetricName': metric_name,
+                  'Dimensions': [{'Name': 'NatGatewayId', 'Value': gateway_id}],
+              },
+              'Period': days * 86400,
+              'Stat': stat,
+          },
+          'ReturnData': True,
+      })
+
+  metrics = {gateway_id: dict.fromkeys(NAT_GATEWAY_METRICS, 0) for gateway_id in gateway_ids}
+  for query_id, values in aws_inventory.get_metric_data(cloudwatch, queries, start_time, end_time).items():
+    gateway_id, metric_name, stat = query_series[query_id]
+    if values:
+      metrics[gateway_id][metric_name] = sum(values) if stat == 'Sum' else max(values)
+  return metrics
+
+
+def collect(target):
+  """Yield a row per NAT Gateway with any vpc and subnet info we can find."""
+  ec2 = target.client('ec2')
+  gateways = list(get_nat_gateways(ec2))
+  names = get_name_index(ec2, gateways)
+
+  for gateway in gateways:
+    yield (gateway['NatGatewayId'],
+           gateway['VpcId'], names.get(gateway['VpcId'], ''),
+           gateway['SubnetId'], names.get(gateway['SubnetId'], ''))
+
+
+def collect_report(target, args):
+  """Yield a row per NAT Gateway with the GB it processed over the last args.days days, the estimated processing cost,
+  the GB for each byte metric, the peak ActiveConnectionCount, and its vpc and subnet info.
+
+  Processed bytes are the outbound traffic (BytesOutToDestination) plus the responses coming back
+  (BytesInFromDestination). BytesInFromSource is the same outbound traffic as it enters the gateway, so adding it
+  would count the outbound bytes twice.
+  """
+  ec2 = target.client('ec2')
+  gateways = list(get_nat_gateways(ec2))
+  names = get_name_index(ec2, gateways)
+  metrics = get_nat_gateway_metrics(target.client('cloudwatch'), [gateway['NatGatewayId'] for gateway in gateways],
+                                    args.days)
+
+  for gateway in gateways:
+    gateway_metrics = metrics[gateway['NatGatewayId']]
+    out_gb, in_gb, source_gb = (gateway_metrics[metric_name] / 1024 ** 3 for metric_name in
+                                ('BytesOutToDestination', 'BytesInFromDestination', 'BytesInFromSource'))
+    processed_gb = out_gb + in_gb
+    yield ('{:.2f}'.format(processed_gb), '{:.2f}'.format(processed_gb * args.price_per_gb),
+           '{:.2f}'.format(out_gb), '{:.2f}'.format(in_gb), '{:.2f}'.format(source_gb),
+           int(gateway_metrics['ActiveConnectionCount']), gateway['NatGatewayId'],
+           gateway['VpcId'], names.get(gateway['VpcId'], ''),
+           gateway['SubnetId'], names.get(gateway['SubnetId'], ''))
 
 
 if __name__ == '__main__':
-  region = 'us-east-1'
-
-  # Get all VPCs, so we can pull the 'Name' tag if it exists
-  vpcs = {}
-  for vpc in get_vpcs(region):
-    vpc_id = vpc['VpcId']
-    vpcs[vpc_id] = vpc
-
-  # Get all subnets, so we can pull the 'Name' tag if it exists
-  subnets = {}
-  for subnet in get_subnets(region):
-    subnet_id = subnet['SubnetId']
-    subnets[subnet_id] = subnet
-
-  # Loop through NAT Gateways and print relevant data.
-  for gateway in get_nat_gateways(region):
-    # Lookup vpc id and VPC 'name' if it's set
-    vpc_id = gateway['VpcId']
-    vpc_name = [tag['Value']
-                for tag in vpcs[vpc_id]['Tags'] if tag['Key'] == 'Name']
-
-    # Lookup subnet id and VPC 'name' if it's set
-    subnet_id = gateway['SubnetId']
-    subnet_name = [tag['Value']
-                   for tag in subnets[subnet_id]['Tags'] if tag['Key'] == 'Name']
-
-    # print NAT gateways with any vpc and subnet info we can find
-    print('{}\t{} {}\t{} {}'.format(
-        gateway['NatGatewayId'],
-        vpc_id, vpc_name,
-        subnet_id, subnet_name
-    ))
+  parser = argparse.ArgumentParser(description='List NAT Gateways along with their VPC and subnet names.')
+  aws_inventory.add_arguments(parser)
+  parser.add_argument('--report', action='store_true',
+                      help='rank NAT Gateways by GB processed, with estimated cost and peak active connections')
+  parser.add_argument('--days', type=int, default=7, help='report window in days (default: %(default)s)')
+  parser.add_argument('--price-per-gb', type=float, default=0.045,
+                      help='NAT Gateway data processing price per GB (default: %(default)s)')
+  args = parser.parse_args()
+  if args.report:
+    aws_inventory.main(functools.partial(collect_report, args=args), args, sort_key=lambda row: -float(row[0]))
+  else:
+    aws_inventory.main(collect, args)
@@ -19,14 +19,80 @@ And five numbers
 24 + 7 - 16 - 3 - 1 = 11
 
 Etc...
+
+The default "subset" strategy finds every parenthesization, not just the
+left-to-right ones the original brute force ("brute" strategy) explores.
+The "numpy" strategy is the same brute force, vectorized with numpy.
+
+Homework reuses the same numbers for many targets, so --build-index FILE
+solves a number set once for every integer target, and --index FILE then
+answers any --target instantly, or lists the --unreachable targets in a
+range.
+
+All arithmetic is exact (fractions.Fraction), so 8 / (3 - 8 / 3) really is
+24. Solutions are printed in a canonical form, with the operands of + and *
+sorted and chains like a - (b - c) flattened to a + c - b, so each
+structurally distinct solution is printed exactly once.
 """
 
+from fractions import Fraction
 from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Set
 from typing import Tuple
 
+import argparse
+import gzip
 import itertools
+import json
 import math
+import multiprocessing
 import operator
+import time
+
+try:
+  import numpy
+except ImportError:  # numpy is only needed for the "numpy" strategy
+  numpy = None
+
+
+MATH_OPS = (operator.add, operator.sub, operator.mul, operator.truediv)
+
+OPERATOR_SYMBOLS = {
+  operator.add: '+',
+  operator.sub: '-',
+  operator.mul: '*',
+  operator.truediv: '/',
+}
+
+# Operators where a + b == b + a, so only one order of the operands needs
+# to be tried.
+COMMUTATIVE_OPS = (operator.add, operator.mul)
+
+# A canonical expression is a nested tuple, either a number ('n', value), or
+# a flattened chain of + and - (or * and /) operands: ('+', added, subtracted)
+# or ('*', multiplied, divided), where both operand tuples are sorted.
+# Expressions which are the same up to commutativity and associativity have
+# the same canonical form.
+Expression = tuple
+
+
+class Solution(NamedTuple):
+  """
+  One solution found by solve(): the expression, the numbers it uses and
+  the target it evaluates to.
+  """
+  expression: str
+  numbers: Tuple[int, ...]
+  target: int
+
+  def __str__(self) -> str:
+    return f'{self.expression} = {self.target}'
 
 
 class ErrorWrongNumberOfOperators(Exception):
@@ -35,11 +101,11 @@ class ErrorWrongNumberOfOperators(Exception):
   """
 
 
-def tuple_math(nums: Tuple[int, ...], operators: Tuple[Callable[[int, int], float]]) -> float:
+def tuple_math(nums: Tuple[int, ...], operators: Tuple[Callable[[Fraction, Fraction], Fraction]]) -> Fraction:
   """
   Given a tuple of ints and a tuple of mathemtical operators from the
   'operator' module (like operator.add, operator.truedev, etc..)
-  return the answer to the given equation.
+  return the exact answer to the given equation, as a Fraction.
 
   For example,
     nums: (1,3,7)
@@ -52,28 +118,21 @@ def tuple_math(nums: Tuple[int, ...], operators: Tuple[Callable[[int, int], floa
 
   # check base cases
   if len(nums) == 0:
-    return 0
+    return Fraction(0)
   if len(nums) == 1:
-    return nums[0]
+    return Fraction(nums[0])
 
   # use the "last" operator on the value of the rest of the equation and the last number.
   return operators[-1](tuple_math(nums[:-1], (operators[:-1])), nums[-1])
 
 
 def display_answer(nums: Tuple[int, ...],
-                   ops: Tuple[Callable[[int, int], float]],
+                   ops: Tuple[Callable[[Fraction, Fraction], Fraction]],
                    target: int,
                    ) -> None:
   """
   Display the answer using proper mathematical syntax.
   """
-  operator_mapping = {
-    str(operator.add): '+',
-    str(operator.sub): '-',
-    str(operator.mul): '*',
-    str(operator.truediv): '/',
-  }
-
   parenthesis = math.ceil(len(nums) / 2)
   print('(' * parenthesis, end='')
   i = 0
@@ -83,37 +142,600 @@ def display_answer(nums: Tuple[int, ...],
       print(')', end='')
       parenthesis -= 1
     if i < len(ops):
-      print(f' {operator_mapping[str(ops[i])]} ', end='')
+      print(f' {OPERATOR_SYMBOLS[ops[i]]} ', end='')
     i += 1
   print(f' = {target}')
 
 
-def main():
+def canonical(op: Callable[[Fraction, Fraction], Fraction],
+              left: Expression,
+              right: Expression,
+              ) -> Expression:
   """
-  Given a list of numbers and a target, find equations that evaluate to
-  the target using all available mathematical operations.
+  Return the canonical form of `left op right`, flattening chains of + and
+  - (or * and /) and sorting their operands.
+  """
+  kind = '+' if op in (operator.add, operator.sub) else '*'
+  left_positive, left_negative = left[1:] if left[0] == kind else ((left,), ())
+  right_positive, right_negative = right[1:] if right[0] == kind else ((right,), ())
+  if op in COMMUTATIVE_OPS:
+    positive, negative = left_positive + right_positive, left_negative + right_negative
+  else:
+    positive, negative = left_positive + right_negative, left_negative + right_positive
+  return (kind, tuple(sorted(positive, reverse=True)), tuple(sorted(negative, reverse=True)))
+
+
+def render(expression: Expression) -> str:
+  """
+  Return a canonical expression using proper mathematical syntax, with
+  only the parenthesis it needs.
+  """
+  if expression[0] == 'n':
+    return str(expression[1])
+  kind, positive, negative = expression
+  inverse = '-' if kind == '+' else '/'
+
+  def operand(child: Expression) -> str:
+    # a sum inside a product is the only place we need parenthesis
+    return f'({render(child)})' if kind == '*' and child[0] == '+' else render(child)
+
+  return (f' {kind} '.join(operand(child) for child in positive)
+          + ''.join(f' {inverse} {operand(child)}' for child in negative))
+
+
+def _splits(mask: int) -> Iterator[Tuple[int, int]]:
+  """
+  Yield every ordered (left, right) split of a bitmask into two disjoint,
+  non-empty sub-masks.
+  """
+  left = (mask - 1) & mask
+  while left:
+    yield left, mask ^ left
+    left = (left - 1) & mask
+
+
+def _split_ops(left: int,
+               right: int,
+               operators: Sequence[Callable[[Fraction, Fraction], Fraction]],
+               ) -> Iterator[Callable[[Fraction, Fraction], Fraction]]:
   """
-  math_ops = [operator.add, operator.sub, operator.mul, operator.truediv]
-  nums = [1,3,7,16,24]
-  target = 11
+  Yield the operators worth trying for a split. Commutative operators are
+  only tried on one of the (left, right) and (right, left) splits.
+  """
+  for op in operators:
+    if left < right or op not in COMMUTATIVE_OPS:
+      yield op
+
+
+def reachable_values(nums: Sequence[int],
+                     operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                     max_size: Optional[int] = None,
+                     ) -> List[Set[Fraction]]:
+  """
+  Return a table, indexed by bitmask over nums, of every value reachable
+  using exactly the numbers in that subset, each once, with any
+  parenthesization. Subsets of more than max_size numbers are left empty.
+
+  The table is built bottom-up: a mask's values come from combining the
+  values of every split into two disjoint sub-masks with each operator.
+  Sub-masks are always smaller than their mask, so they're already done.
+  Division by zero is skipped.
+  """
+  values = [set() for _ in range(1 << len(nums))]
+  for mask in range(1, 1 << len(nums)):
+    if max_size is not None and bin(mask).count('1') > max_size:
+      continue
+    if mask & (mask - 1) == 0:
+      values[mask].add(Fraction(nums[mask.bit_length() - 1]))
+      continue
+    for left, right in _splits(mask):
+      for op in _split_ops(left, right, operators):
+        for x in values[left]:
+          for y in values[right]:
+            if op is not operator.truediv or y != 0:
+              values[mask].add(op(x, y))
+  return values
+
+
+def _operands(op: Callable[[Fraction, Fraction], Fraction],
+              xs: Set[Fraction],
+              ys: Set[Fraction],
+              value: Fraction,
+              ) -> Iterator[Tuple[Fraction, Fraction]]:
+  """
+  Yield every (x, y) from xs and ys where `x op y == value`, never
+  dividing by zero. Since the arithmetic is exact, y can be solved for
+  instead of trying every pair.
+  """
+  for x in xs:
+    if op is operator.add:
+      candidates = [value - x]
+    elif op is operator.sub:
+      candidates = [x - value]
+    elif op is operator.mul:
+      candidates = ys if x == 0 and value == 0 else [value / x] if x != 0 else []
+    elif op is operator.truediv:
+      candidates = [y for y in ys if y != 0] if x == 0 and value == 0 else [x / value] if value != 0 else []
+    else:
+      candidates = [y for y in ys if op(x, y) == value]
+    for y in candidates:
+      if y in ys and (op is not operator.truediv or y != 0):
+        yield x, y
+
+
+def build_expressions(nums: Sequence[int],
+                      values: List[Set[Fraction]],
+                      mask: int,
+                      value: Fraction,
+                      operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                      cache: Dict[Tuple[int, Fraction], List[Expression]] = None,
+                      ) -> Iterator[Expression]:
+  """
+  Lazily yield the canonical form of every expression using exactly the
+  numbers in mask which evaluates to value, walking back down the
+  reachable_values() table. Only the values which lead to the target are
+  ever expanded, and each (mask, value) is only fully expanded once.
+
+  The left operand of each split is expanded lazily, so the first
+  solutions come out long before the last ones are found.
+  """
+  if cache is None:
+    cache = {}
+  if (mask, value) in cache:
+    yield from cache[mask, value]
+    return
+
+  # a dict, rather than a set, keeps the output order stable
+  expressions = {}
+  if mask & (mask - 1) == 0:
+    if nums[mask.bit_length() - 1] == value:
+      expressions[('n', value)] = None
+      yield ('n', value)
+  else:
+    for left, right in _splits(mask):
+      for op in _split_ops(left, right, operators):
+        for x, y in _operands(op, values[left], values[right], value):
+          right_expressions = list(build_expressions(nums, values, right, y, operators, cache))
+          for left_expression in build_expressions(nums, values, left, x, operators, cache):
+            for right_expression in right_expressions:
+              expression = canonical(op, left_expression, right_expression)
+              if expression not in expressions:
+                expressions[expression] = None
+                yield expression
+  # only reached once every expression has been yielded
+  cache[mask, value] = list(expressions)
+
+
+def _mask_numbers(nums: Sequence[int], mask: int) -> Tuple[int, ...]:
+  """
+  Return the numbers selected by a bitmask over nums.
+  """
+  return tuple(num for i, num in enumerate(nums) if mask >> i & 1)
+
+
+def _solve_masks(nums: Sequence[int],
+                 target: int,
+                 sizes: Sequence[int],
+                 operators: Sequence[Callable[[Fraction, Fraction], Fraction]],
+                 ) -> Iterator[Tuple[int, Expression]]:
+  """
+  Yield (mask, canonical expression) for every expression using exactly
+  `size` of nums, for each of the given sizes, which evaluates to target.
+  All subsets are solved in one pass over the reachable_values() table.
+  """
+  if not sizes:
+    return
+  # The largest subsets have by far the most values, and we never need
+  # them: build_expressions() only looks at the values of sub-masks.
+  largest = max(sizes)
+  values = reachable_values(nums, operators, largest - 1)
+  cache = {}
+  for mask in range(1, 1 << len(nums)):
+    size = bin(mask).count('1')
+    if size in sizes and (size == largest or target in values[mask]):
+      for expression in build_expressions(nums, values, mask, Fraction(target), operators, cache):
+        yield mask, expression
+
+
+def _split_work(nums: Sequence[int], sizes: Sequence[int]) -> List[Tuple[int, int, int]]:
+  """
+  Return the (mask, left, right) work items for solving every subset of
+  nums with one of the given sizes: one per top-level split of each mask,
+  or (mask, mask, 0) for a single number. Items are ordered cheapest
+  first, by the size of their larger half, since that half's table of
+  reachable values dominates the cost.
+  """
+  items = []
+  for size in sizes:
+    for combination in itertools.combinations(range(len(nums)), size):
+      mask = sum(1 << i for i in combination)
+      if size == 1:
+        items.append((mask, mask, 0))
+      else:
+        items.extend((mask, left, right) for left, right in _splits(mask))
+  items.sort(key=lambda item: max(bin(item[1]).count('1'), bin(item[2]).count('1')))
+  return items
+
+
+def _solve_split(nums: Sequence[int],
+                 target: int,
+                 operators: Sequence[Callable[[Fraction, Fraction], Fraction]],
+                 left: int,
+                 right: int,
+                 ) -> Iterator[Expression]:
+  """
+  Yield the canonical form of every expression combining the numbers in
+  left with those in right, at the top level, which evaluates to target.
+  Each half gets its own reachable_values() table, so the work for one
+  split doesn't depend on any other.
+  """
+  value = Fraction(target)
+  if not right:
+    if nums[left.bit_length() - 1] == value:
+      yield ('n', value)
+    return
+  left_nums, right_nums = _mask_numbers(nums, left), _mask_numbers(nums, right)
+  left_values, right_values = reachable_values(left_nums, operators), reachable_values(right_nums, operators)
+  left_all, right_all = (1 << len(left_nums)) - 1, (1 << len(right_nums)) - 1
+  cache, right_cache = {}, {}
+  for op in _split_ops(left, right, operators):
+    for x, y in _operands(op, left_values[left_all], right_values[right_all], value):
+      right_expressions = list(build_expressions(right_nums, right_values, right_all, y, operators, right_cache))
+      for left_expression in build_expressions(left_nums, left_values, left_all, x, operators, cache):
+        for right_expression in right_expressions:
+          yield canonical(op, left_expression, right_expression)
+
+
+# Solutions a pool worker collects before sending them back to solve(),
+# and the longest it holds on to them, in seconds.
+RESULT_BATCH_SIZE = 100
+RESULT_BATCH_SECONDS = 0.5
 
-  number_of_operands = 5
+# Set in each pool worker by _init_worker()
+_results = None
 
+
+def _init_worker(results: multiprocessing.Queue) -> None:
+  """
+  Process pool initializer: keep the queue solutions are sent back on.
+  """
+  global _results  # pylint: disable=global-statement
+  _results = results
+
+
+def _solve_chunk(task: Tuple[Sequence[int], int, Sequence[Callable[[Fraction, Fraction], Fraction]],
+                             List[Tuple[int, int, int]]],
+                 ) -> None:
+  """
+  Process pool worker: solve each (mask, left, right) split in a chunk,
+  streaming batches of (numbers, canonical expression) back on the
+  results queue as they're found, then None once the chunk is done.
+  """
+  nums, target, operators, items = task
+  seen = set()
+  batch = []
+  sent = time.monotonic()
+  try:
+    for mask, left, right in items:
+      numbers = _mask_numbers(nums, mask)
+      for expression in _solve_split(nums, target, operators, left, right):
+        if expression not in seen:
+          seen.add(expression)
+          batch.append((numbers, expression))
+          if len(batch) >= RESULT_BATCH_SIZE or time.monotonic() - sent >= RESULT_BATCH_SECONDS:
+            _results.put(batch)
+            batch = []
+            sent = time.monotonic()
+    if batch:
+      _results.put(batch)
+  finally:
+    _results.put(None)
+
+
+def solve(nums: Sequence[int],
+          target: int,
+          sizes: Sequence[int],
+          operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+          workers: int = 1,
+          limit: Optional[int] = None,
+          chunk_size: int = 8,
+          ) -> Iterator[Solution]:
+  """
+  Lazily yield a Solution for every structurally distinct expression
+  using exactly `size` of nums, for each of the given sizes, which
+  evaluates to target. Stop after `limit` solutions, if given.
+
+  With workers > 1, the top-level splits of every subset are handed out
+  to a process pool in chunks of chunk_size, so even a single subset
+  (e.g. all of nums) is solved in parallel. Balanced splits only need
+  small tables and go first, so the first solutions come back quickly.
+  Workers stream solutions back in small batches as they find them, and
+  the pool is terminated as soon as we stop (after `limit` solutions, or
+  when the caller stops iterating), even mid-chunk. Each split is solved from
+  scratch, so this does more work in total than workers=1, and needs
+  the `limit` for the largest number sets: finding every solution using
+  all of 9 numbers still isn't interactive.
+  """
+  if limit is not None and limit <= 0:
+    return
+
+  # Repeated numbers can give the same expression for different subsets
+  seen = set()
+  if workers <= 1:
+    found = ((_mask_numbers(nums, mask), expression)
+             for mask, expression in _solve_masks(nums, target, sizes, operators))
+    for numbers, expression in found:
+      if expression not in seen:
+        seen.add(expression)
+        yield Solution(render(expression), numbers, target)
+        if len(seen) == limit:
+          return
+    return
+
+  items = iter(_split_work(nums, sizes))
+  tasks = [(nums, target, operators, chunk)
+           for chunk in iter(lambda: list(itertools.islice(items, chunk_size)), [])]
+  results = multiprocessing.Queue()
+  with multiprocessing.Pool(workers, _init_worker, (results,)) as pool:
+    chunks = pool.map_async(_solve_chunk, tasks, chunksize=1)
+    remaining = len(tasks)
+    while remaining:
+      batch = results.get()
+      if batch is None:
+        remaining -= 1
+        continue
+      for numbers, expression in batch:
+        if expression not in seen:
+          seen.add(expression)
+          yield Solution(render(expression), numbers, target)
+          if len(seen) == limit:
+            return
+    # re-raise any exception from a worker
+    chunks.get()
+
+
+def solve_subsets(nums: Sequence[int],
+                  target: int,
+                  sizes: Sequence[int],
+                  operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                  ) -> Iterator[str]:
+  """
+  Yield every structurally distinct expression using exactly `size` of
+  nums, for each of the given sizes, which evaluates to target.
+  """
+  for solution in solve(nums, target, sizes, operators):
+    yield solution.expression
+
+
+# Most (permutation, operator tuple) pairs evaluated per numpy batch.
+VECTORIZED_BATCH_SIZE = 1 << 20
+
+
+def brute_force_hits(nums: Sequence[int],
+                     target: int,
+                     number_of_operands: int,
+                     operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                     ) -> Iterator[Tuple[Tuple[int, ...], Tuple[Callable[[Fraction, Fraction], Fraction], ...]]]:
+  """
+  Brute force every permutation and operator combination, evaluating
+  left to right with tuple_math(), and yield the (permutation, operators)
+  which evaluate to the target.
+  """
   # loop through all possible combinations of the input set
   for combination in itertools.combinations(nums, number_of_operands):
     # check all permutations of each combination. Order doesn't matter for
     # addition and multiplication, but it *does* matter for subtraction and
     # division.
-    #
-    # Depending on the operator, some of these will be redundent, but
-    # that's okay.
     for permutation in itertools.permutations(combination):
       # check all possible operations for each permutation
-      for ops in itertools.product(math_ops, repeat=len(permutation)-1):
-        # print(f'{permutation} of {ops}: {tuple_math(permutation, ops)}')
-        if tuple_math(permutation, ops) == target:
-          # print(f'{permutation} using {ops}')
-          display_answer(permutation, ops, target)
+      for ops in itertools.product(operators, repeat=len(permutation)-1):
+        try:
+          if tuple_math(permutation, ops) == target:
+            yield permutation, ops
+        except ZeroDivisionError:
+          continue
+
+
+def vectorized_hits(nums: Sequence[int],
+                    target: int,
+                    number_of_operands: int,
+                    operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                    ) -> Iterator[Tuple[Tuple[int, ...], Tuple[Callable[[Fraction, Fraction], Fraction], ...]]]:
+  """
+  Same as brute_force_hits(), but evaluate all the operator combinations
+  for a batch of permutations at once as numpy array operations.
+  Division by zero is masked out, and every float hit is confirmed with
+  exact tuple_math() before it's yielded.
+  """
+  if numpy is None:
+    raise ImportError('the "numpy" strategy requires numpy')
+
+  # every operator tuple, as a (len(operators)^(n-1), n-1) array of indexes into MATH_OPS
+  op_tuples = list(itertools.product(operators, repeat=number_of_operands-1))
+  op_table = numpy.array([[MATH_OPS.index(op) for op in ops] for ops in op_tuples],
+                         dtype=numpy.int8).reshape(len(op_tuples), number_of_operands-1)
+  batch_size = max(1, VECTORIZED_BATCH_SIZE // len(op_tuples))
+
+  permutations = itertools.chain.from_iterable(
+    itertools.permutations(combination) for combination in itertools.combinations(nums, number_of_operands))
+  for batch in iter(lambda: list(itertools.islice(permutations, batch_size)), []):
+    operands = numpy.array(batch, dtype=numpy.float64)
+    # rows are permutations, columns are operator tuples
+    result = numpy.repeat(operands[:, :1], len(op_tuples), axis=1)
+    valid = numpy.ones(result.shape, dtype=bool)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      for i in range(number_of_operands - 1):
+        num = operands[:, i + 1:i + 2]
+        ops = op_table[:, i]
+        result = numpy.select([ops == 0, ops == 1, ops == 2, ops == 3],
+                              [result + num, result - num, result * num, result / num])
+        valid &= ~((ops == 3) & (num == 0))
+    hits = valid & numpy.isclose(result, target, rtol=1e-9, atol=1e-9)
+    for row, column in zip(*numpy.nonzero(hits)):
+      permutation, ops = batch[row], op_tuples[column]
+      if tuple_math(permutation, ops) == target:
+        yield permutation, ops
+
+
+def brute_force_solutions(nums: Sequence[int],
+                          target: int,
+                          number_of_operands: int,
+                          operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                          vectorized: bool = False,
+                          ) -> Iterator[Tuple[Tuple[int, ...], Tuple[Callable[[Fraction, Fraction], Fraction], ...],
+                                              Expression]]:
+  """
+  Yield (permutation, operators, canonical expression) for the brute
+  force hits, skipping orderings which only differ by commutativity or
+  associativity. With vectorized=True, use numpy to do the evaluation.
+  """
+  seen = set()
+  hits = vectorized_hits if vectorized else brute_force_hits
+  for permutation, ops in hits(nums, target, number_of_operands, operators):
+    expression = ('n', Fraction(permutation[0]))
+    for op, num in zip(ops, permutation[1:]):
+      expression = canonical(op, expression, ('n', Fraction(num)))
+    if expression not in seen:
+      seen.add(expression)
+      yield permutation, ops, expression
+
+
+def solve_brute(nums: Sequence[int], target: int, number_of_operands: int, vectorized: bool = False) -> None:
+  """
+  Brute force every permutation and operator combination, evaluating
+  left to right, and display the ones which evaluate to the target.
+  Orderings which only differ by commutativity or associativity are
+  displayed once. With vectorized=True, use numpy to do the evaluation.
+  """
+  for permutation, ops, _ in brute_force_solutions(nums, target, number_of_operands, vectorized=vectorized):
+    display_answer(permutation, ops, target)
+
+
+def build_index(nums: Sequence[int],
+                sizes: Sequence[int],
+                operators: Sequence[Callable[[Fraction, Fraction], Fraction]] = MATH_OPS,
+                ) -> Dict[int, Dict[int, List[str]]]:
+  """
+  Solve nums once for every reachable integer target, returning
+  {size: {target: [expression, ...]}} for each of the given sizes.
+
+  Unlike solve(), which walks back down from a single target, this is one
+  forward pass over the subsets: every subset's {value: expressions} table
+  is built from those of its two halves, in the same order as
+  reachable_values(). Only integer values are kept for the largest
+  subsets, since nothing is built from them.
+  """
+  if not sizes:
+    return {}
+  largest = max(sizes)
+  # a dict, rather than a set, dedupes expressions but keeps their order
+  expressions = [{} for _ in range(1 << len(nums))]
+  index = {size: {} for size in sizes}
+  for mask in range(1, 1 << len(nums)):
+    size = bin(mask).count('1')
+    if size > largest:
+      continue
+    table = expressions[mask]
+    if mask & (mask - 1) == 0:
+      value = Fraction(nums[mask.bit_length() - 1])
+      table[value] = {('n', value): None}
+    else:
+      for left, right in _splits(mask):
+        for op in _split_ops(left, right, operators):
+          for x, left_expressions in expressions[left].items():
+            for y, right_expressions in expressions[right].items():
+              if op is operator.truediv and y == 0:
+                continue
+              value = op(x, y)
+              if size == largest and value.denominator != 1:
+                continue
+              found = table.setdefault(value, {})
+              for left_expression in left_expressions:
+                for right_expression in right_expressions:
+                  found[canonical(op, left_expression, right_expression)] = None
+    if size in index:
+      for value, found in table.items():
+        if value.denominator == 1:
+          index[size].setdefault(int(value), {}).update((render(expression), None) for expression in found)
+    if size == largest:
+      expressions[mask] = None
+  return {size: {target: list(solutions) for target, solutions in sorted(targets.items())}
+          for size, targets in index.items()}
+
+
+def save_index(path: str, nums: Sequence[int], index: Dict[int, Dict[int, List[str]]]) -> None:
+  """
+  Save an index from build_index() as gzipped JSON.
+  """
+  with gzip.open(path, 'wt', encoding='utf-8') as index_file:
+    json.dump({'nums': list(nums), 'index': index}, index_file, separators=(',', ':'))
+
+
+def load_index(path: str) -> Tuple[List[int], Dict[int, Dict[int, List[str]]]]:
+  """
+  Load the (nums, index) saved by save_index().
+  """
+  with gzip.open(path, 'rt', encoding='utf-8') as index_file:
+    data = json.load(index_file)
+  index = {int(size): {int(target): solutions for target, solutions in targets.items()}
+           for size, targets in data['index'].items()}
+  return data['nums'], index
+
+
+def unreachable_targets(index: Dict[int, Dict[int, List[str]]], low: int, high: int) -> Dict[int, List[int]]:
+  """
+  Return {size: [target, ...]} of every target from low to high
+  (inclusive) with no solution, for each size in the index.
+  """
+  return {size: [target for target in range(low, high + 1) if target not in targets]
+          for size, targets in index.items()}
+
+
+def main():
+  """
+  Given a list of numbers and a target, find equations that evaluate to
+  the target using all available mathematical operations.
+  """
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('nums', nargs='*', type=int, default=[1, 3, 7, 16, 24],
+                      help='the set of numbers (default: 1 3 7 16 24)')
+  parser.add_argument('--target', type=int, default=11, help='default: %(default)s')
+  parser.add_argument('--sizes', nargs='+', type=int, default=[5],
+                      help='how many of the numbers each equation uses (default: 5)')
+  parser.add_argument('--strategy', choices=('subset', 'brute', 'numpy'), default='subset',
+                      help='default: %(default)s')
+  parser.add_argument('--workers', type=int, default=1,
+                      help='solve across this many processes (default: %(default)s)')
+  parser.add_argument('--limit', type=int, help='stop after this many solutions')
+  parser.add_argument('--build-index', metavar='FILE',
+                      help='solve nums for every target and save the answers to FILE')
+  parser.add_argument('--index', metavar='FILE', help='look up answers in FILE instead of solving')
+  parser.add_argument('--unreachable', nargs=2, type=int, metavar=('LOW', 'HIGH'),
+                      help='with --index, list the targets from LOW to HIGH with no solution')
+  args = parser.parse_args()
+
+  if args.strategy == 'numpy' and numpy is None:
+    parser.error('the "numpy" strategy requires numpy')
+
+  if args.build_index:
+    save_index(args.build_index, args.nums, build_index(args.nums, args.sizes))
+  elif args.index:
+    nums, index = load_index(args.index)
+    for size in args.sizes:
+      if size not in index:
+        parser.error(f'{args.index} has no answers using {size} of {nums}')
+      if args.unreachable:
+        print(f'{size} numbers: {unreachable_targets({size: index[size]}, *args.unreachable)[size]}')
+      else:
+        for expression in index[size].get(args.target, [])[:args.limit]:
+          print(f'{expression} = {args.target}')
+  elif args.strategy in ('brute', 'numpy'):
+    for number_of_operands in args.sizes:
+      solve_brute(args.nums, args.target, number_of_operands, vectorized=args.strategy == 'numpy')
+  else:
+    for solution in solve(args.nums, args.target, args.sizes, workers=args.workers, limit=args.limit):
+      print(solution, flush=True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,219 @@
+"""
+Benchmark the krypto_hw.py solver strategies over a grid of number set
+sizes, operator sets and targets.
+
+Each case uses every one of the first COUNT numbers of BENCH_NUMBERS. For
+each strategy it records the wall time, the number of expressions
+evaluated (and so expressions per second), the peak memory allocated
+(measured by tracemalloc, in a second untimed run) and the number of
+solutions, and writes them all to a JSON file.
+
+The strategies are also cross-checked on every case: "numpy" must find the
+same solutions as "brute", "subset-parallel" the same as "subset", and
+every left-to-right "brute" solution must also be found by "subset". Any
+disagreement is reported and makes the benchmark exit non-zero, so a
+speedup can't silently change the answers.
+
+Strategies get slow quickly, so each one is skipped (and recorded as
+skipped) above its MAX_COUNTS entry, unless --max-count overrides it.
+Peak memory of "subset-parallel" only covers the parent process.
+"""
+
+from fractions import Fraction
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+import argparse
+import datetime
+import json
+import math
+import operator
+import platform
+import sys
+import time
+import tracemalloc
+
+import krypto_hw
+
+# The first COUNT of these are the numbers for a case using COUNT numbers.
+BENCH_NUMBERS = (1, 3, 7, 16, 24, 2, 5, 9, 12)
+
+OPERATOR_SETS = {
+  '+-*/': krypto_hw.MATH_OPS,
+  '+-': (operator.add, operator.sub),
+  '+*': (operator.add, operator.mul),
+}
+
+# Largest number set each strategy is run on by default.
+MAX_COUNTS = {
+  'brute': 6,
+  'numpy': 7,
+  'subset': 6,
+  'subset-parallel': 6,
+}
+
+
+def brute_evaluations(count: int, operators: Sequence[Callable[[Fraction, Fraction], Fraction]]) -> int:
+  """
+  Return the number of (permutation, operator tuple) pairs the brute
+  force strategies evaluate to use all of `count` numbers.
+  """
+  return math.factorial(count) * len(operators) ** (count - 1)
+
+
+def subset_evaluations(nums: Sequence[int], operators: Sequence[Callable[[Fraction, Fraction], Fraction]]) -> int:
+  """
+  Return the number of operator applications the "subset" strategy
+  makes building its reachable_values() table to use all of nums (the
+  table stops one number short of the full set).
+  """
+  values = krypto_hw.reachable_values(nums, operators, len(nums) - 1)
+  evaluations = 0
+  for mask in range(1, 1 << len(nums)):
+    if bin(mask).count('1') < len(nums):
+      for left, right in krypto_hw._splits(mask):  # pylint: disable=protected-access
+        pair = len(values[left]) * len(values[right])
+        for op in operators:
+          if op not in krypto_hw.COMMUTATIVE_OPS or left < right:
+            evaluations += pair
+  return evaluations
+
+
+def run_strategy(strategy: str,
+                 nums: Sequence[int],
+                 target: int,
+                 operators: Sequence[Callable[[Fraction, Fraction], Fraction]],
+                 workers: int,
+                 ) -> Set[str]:
+  """
+  Solve with the given strategy, using all of nums, and return the set
+  of rendered solutions.
+  """
+  if strategy in ('brute', 'numpy'):
+    return {krypto_hw.render(expression) for _, _, expression in
+            krypto_hw.brute_force_solutions(nums, target, len(nums), operators, vectorized=strategy == 'numpy')}
+  return {solution.expression for solution in
+          krypto_hw.solve(nums, target, [len(nums)], operators,
+                          workers=workers if strategy == 'subset-parallel' else 1)}
+
+
+def measure(strategy: str,
+            nums: Sequence[int],
+            target: int,
+            operators: Sequence[Callable[[Fraction, Fraction], Fraction]],
+            workers: int,
+            memory: bool,
+            ) -> Tuple[Dict[str, Any], Set[str]]:
+  """
+  Run one strategy on one case, returning (result record, solutions).
+  """
+  start = time.perf_counter()
+  solutions = run_strategy(strategy, nums, target, operators, workers)
+  seconds = time.perf_counter() - start
+
+  if strategy in ('brute', 'numpy'):
+    evaluations = brute_evaluations(len(nums), operators)
+  else:
+    evaluations = subset_evaluations(nums, operators)
+
+  peak_bytes = None
+  if memory:
+    tracemalloc.start()
+    run_strategy(strategy, nums, target, operators, workers)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+  return {
+    'seconds': round(seconds, 6),
+    'evaluations': evaluations,
+    'evaluations_per_second': round(evaluations / seconds) if seconds else None,
+    'peak_bytes': peak_bytes,
+    'solutions': len(solutions),
+  }, solutions
+
+
+def check_agreement(solutions: Dict[str, Set[str]]) -> List[str]:
+  """
+  Return a description of each way the strategies' solutions disagree.
+  """
+  problems = []
+  for one, other in (('brute', 'numpy'), ('subset', 'subset-parallel')):
+    if one in solutions and other in solutions and solutions[one] != solutions[other]:
+      problems.append(f'{one} and {other} differ: '
+                      f'{sorted(solutions[one] ^ solutions[other])[:5]}')
+  if 'brute' in solutions and 'subset' in solutions and not solutions['brute'] <= solutions['subset']:
+    problems.append(f'subset misses brute solutions: {sorted(solutions["brute"] - solutions["subset"])[:5]}')
+  return problems
+
+
+def main():
+  """
+  Run the benchmark grid and write the results.
+  """
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--counts', nargs='+', type=int, default=list(range(3, len(BENCH_NUMBERS) + 1)),
+                      help='how many numbers to use (default: 3 to 9)')
+  parser.add_argument('--targets', nargs='+', type=int, default=[11, 24], help='default: %(default)s')
+  parser.add_argument('--operators', nargs='+', choices=OPERATOR_SETS, default=list(OPERATOR_SETS),
+                      help='operator sets (default: all of them)')
+  parser.add_argument('--strategies', nargs='+', choices=MAX_COUNTS, default=list(MAX_COUNTS),
+                      help='default: all of them')
+  parser.add_argument('--max-count', type=int,
+                      help='run every strategy on number sets up to this size, ignoring MAX_COUNTS')
+  parser.add_argument('--workers', type=int, default=2,
+                      help='processes for the "subset-parallel" strategy (default: %(default)s)')
+  parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory (halves the run time)")
+  parser.add_argument('--output', default='krypto_hw_bench.json', help='default: %(default)s')
+  args = parser.parse_args()
+
+  strategies = args.strategies
+  if krypto_hw.numpy is None and 'numpy' in strategies:
+    print('numpy is not installed, skipping the "numpy" strategy', file=sys.stderr)
+    strategies = [strategy for strategy in strategies if strategy != 'numpy']
+
+  results = []
+  disagreements = 0
+  for count in args.counts:
+    nums = BENCH_NUMBERS[:count]
+    for operator_set in args.operators:
+      for target in args.targets:
+        solutions = {}
+        for strategy in strategies:
+          case = {'count': count, 'nums': list(nums), 'operators': operator_set, 'target': target,
+                  'strategy': strategy}
+          if count > (args.max_count or MAX_COUNTS[strategy]):
+            results.append(dict(case, skipped=True))
+            continue
+          result, solutions[strategy] = measure(strategy, nums, target, OPERATOR_SETS[operator_set],
+                                                args.workers, not args.no_memory)
+          results.append(dict(case, **result))
+          print(f'{count} numbers {operator_set:5} target {target:3} {strategy:16} '
+                f'{result["seconds"]:10.3f}s {result["solutions"]:6} solutions', flush=True)
+        for problem in check_agreement(solutions):
+          disagreements += 1
+          results.append({'count': count, 'nums': list(nums), 'operators': operator_set, 'target': target,
+                          'disagreement': problem})
+          print(f'{count} numbers {operator_set:5} target {target:3} DISAGREE {problem}', flush=True)
+
+  with open(args.output, 'w') as output:
+    json.dump({
+      'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'numpy': krypto_hw.numpy.__version__ if krypto_hw.numpy is not None else None,
+      'results': results,
+    }, output, indent=2)
+    output.write('\n')
+
+  if disagreements:
+    sys.exit(f'{disagreements} disagreements between strategies, see {args.output}')
+
+
+if __name__ == '__main__':
+  main()
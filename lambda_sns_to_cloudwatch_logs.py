@@ -4,18 +4,143 @@ environment variables:
 - CLOUDWATCH_LOG_GROUP_NAME: The Cloudwatch Logs group where messages should be
 sent. A stream will be created in this log group matching the SNS Topic ARN
 (invalid characters replaced with '_').
+
+Records are grouped by stream and written in as few put_log_events calls as
+the service limits allow. The logs client and the set of streams known to
+exist are kept at module scope, so warm invocations make no create_log_stream
+calls. In Lambda, the configuration is validated and the client created during
+the init phase, at import.
+
+Each invocation prints its metrics (records, skipped records, rejected log
+events, put_log_events and create_log_stream calls and latency) to stdout in
+CloudWatch Embedded Metric Format, which CloudWatch turns into metrics in the
+METRICS_NAMESPACE namespace without any PutMetricData calls.
+https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
 """
+import contextlib
+import json
 import datetime
 import os
 import time
 
-import boto3
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# botocore alone imports faster than boto3, and we only need a client
+import botocore.config
+import botocore.session
+
+# put_log_events limits
+# https://docs.aws.amazon.com/AmazonCloudWatchLogs/latest/APIReference/API_PutLogEvents.html
+MAX_BATCH_EVENTS = 10000
+MAX_BATCH_BYTES = 1048576
+# Bytes counted towards MAX_BATCH_BYTES for each event, on top of its message
+EVENT_OVERHEAD_BYTES = 26
+# A batch cannot span more than 24 hours
+MAX_BATCH_SPAN_MS = 24 * 60 * 60 * 1000
+
+# A log event, plus the index of the SNS record it came from
+LogEvent = Tuple[Dict, int]
+
+# The handler makes one call at a time, so a small pool is enough. Fail fast
+# rather than spend the invocation's time budget on a hung connection.
+BOTO_CONFIG = botocore.config.Config(
+  connect_timeout=2,
+  read_timeout=10,
+  retries={'mode': 'standard', 'max_attempts': 3},
+  max_pool_connections=2,
+  tcp_keepalive=True,
+)
+
+METRICS_NAMESPACE = 'SnsToCloudwatchLogs'
+# Embedded Metric Format accepts at most 100 values per metric
+MAX_METRIC_VALUES = 100
+
+# Reused across warm invocations of the same Lambda container
+_log_group_name = None
+_logs_client = None
+# (log group name, log stream name) of streams known to exist
+_known_log_streams = set()
 
 
 class MissingEnvironmentVariableException(Exception):
   """Raised if a required environment variable is missing."""
 
 
+class Metrics:
+  """Counts and latencies for one invocation, printed in Embedded Metric
+  Format.
+  """
+  COUNTS = ('Records', 'SkippedRecords', 'RejectedLogEvents',
+            'PutLogEventsCalls', 'CreateLogStreamCalls')
+  LATENCIES = ('PutLogEventsLatency', 'CreateLogStreamLatency')
+
+  def __init__(self):
+    self.counts = dict.fromkeys(self.COUNTS, 0)
+    self.latencies = {name: [] for name in self.LATENCIES}
+
+  def add(self, name: str, count: int = 1) -> None:
+    """Adds to a count."""
+    self.counts[name] += count
+
+  @contextlib.contextmanager
+  def timer(self, name: str) -> Iterator[None]:
+    """Times the with block as one {name}Calls count and {name}Latency value.
+    """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.latencies[f'{name}Latency'].append(
+        (time.perf_counter() - start) * 1000)
+      self.counts[f'{name}Calls'] += 1
+
+  def to_emf(self) -> Iterator[Dict]:
+    """Yields the Embedded Metric Format documents for these metrics; more
+    than one if there are more than MAX_METRIC_VALUES latencies.
+    """
+    dimensions = {}
+    if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+      dimensions['FunctionName'] = os.environ['AWS_LAMBDA_FUNCTION_NAME']
+    values = dict(self.counts)
+    units = dict.fromkeys(self.COUNTS, 'Count')
+    latencies = self.latencies
+    while True:
+      for name, latency in latencies.items():
+        if latency:
+          values[name] = latency[:MAX_METRIC_VALUES]
+          units[name] = 'Milliseconds'
+      yield dict({
+        '_aws': {
+          'Timestamp': int(time.time() * 1000),
+          'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [list(dimensions)],
+            'Metrics': [{'Name': name, 'Unit': unit}
+                        for name, unit in units.items()],
+          }],
+        },
+      }, **dimensions, **values)
+      latencies = {name: latency[MAX_METRIC_VALUES:]
+                   for name, latency in latencies.items()
+                   if len(latency) > MAX_METRIC_VALUES}
+      if not latencies:
+        return
+      values = {}
+      units = {}
+
+  def emit(self) -> None:
+    """Prints the metrics to stdout, where Lambda sends them to CloudWatch
+    Logs.
+    """
+    for document in self.to_emf():
+      print(json.dumps(document, separators=(',', ':')))
+
+
 def iso_to_epoch_ms(iso_format: str) -> int:
   """Takes a string in ISO format and returns seconds since epoch in ms
   presision.
@@ -34,49 +159,174 @@ def get_log_group_name() -> str:
   return os.environ['CLOUDWATCH_LOG_GROUP_NAME']
 
 
-# event: https://docs.aws.amazon.com/lambda/latest/dg/with-sns.html
-# context: https://docs.aws.amazon.com/lambda/latest/dg/python-context.html
-def lambda_handler(event, _) -> None:
-  """Lambda calls this function to do the work.
+def get_log_stream_name(topic_arn: str) -> str:
+  """Returns the Cloudwatch Log stream name for an SNS Topic ARN. Names cannot
+  contain ':' or '*' and must be 512 characters or less.
+  https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-logs-logstream.html
   """
-  logs = boto3.client('logs')
+  return topic_arn.replace(':', '_').replace('*', '_')[:512]
 
-  log_group_name = get_log_group_name()
 
-  for record in event['Records']:
+def group_records(records: List[Dict]) -> Dict[str, List[LogEvent]]:
+  """Returns a dict of log stream name -> that stream's log events, sorted by
+  timestamp. Records without a message are skipped.
+  """
+  now = int(time.time() * 1000)
+  streams = {}
+  for index, record in enumerate(records):
     if not 'Message' in record['Sns']:
       print('SNS event contained no message, skipping')
       continue
 
-    # Create Cloudwatch Log stream. Names cannot contain ':' or '*' and must be
-    # 512 cahracters or less
-    # https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-logs-logstream.html
-    sns_topic_arn = (record['Sns']['TopicArn']
-      .replace(':', '_').replace('*','_')[:512])
-    try:
-      logs.create_log_stream(logGroupName=log_group_name,
-                             logStreamName=sns_topic_arn)
-    except logs.exceptions.ResourceAlreadyExistsException:
-      # log stream already exists, which is fine
-      pass
-
     # Use SNS event timestamp if possible, else use current time
     if 'Timestamp' in record['Sns']:
       timestamp = iso_to_epoch_ms(record['Sns']['Timestamp'])
     else:
-      timestamp = int(time.time() * 1000)
-
-    # put log event in Cloudwatch Logs
-    response = logs.put_log_events(
-      logGroupName=log_group_name,
-      logStreamName=sns_topic_arn,
-      logEvents=[
-        {
-          'timestamp': timestamp,
-          'message': record['Sns']['Message']
-        }
-      ]
-    )
-
-    if 'rejectedLogEventsInfo' in response:
-      print(f'An error occurred: {response}')
+      timestamp = now
+
+    log_stream_name = get_log_stream_name(record['Sns']['TopicArn'])
+    streams.setdefault(log_stream_name, []).append(
+      ({'timestamp': timestamp, 'message': record['Sns']['Message']}, index))
+
+  for log_events in streams.values():
+    # put_log_events requires chronological order; the sort is stable, so
+    # records with the same timestamp keep their order
+    log_events.sort(key=lambda log_event: log_event[0]['timestamp'])
+  return streams
+
+
+def batch_log_events(log_events: List[LogEvent]) -> Iterator[List[LogEvent]]:
+  """Splits sorted log events into batches within the put_log_events limits on
+  event count, total size and time span.
+  """
+  batch = []
+  batch_bytes = 0
+  for log_event in log_events:
+    event_bytes = (len(log_event[0]['message'].encode('utf-8'))
+                   + EVENT_OVERHEAD_BYTES)
+    if batch and (len(batch) == MAX_BATCH_EVENTS
+                  or batch_bytes + event_bytes > MAX_BATCH_BYTES
+                  or log_event[0]['timestamp'] - batch[0][0]['timestamp']
+                  >= MAX_BATCH_SPAN_MS):
+      yield batch
+      batch = []
+      batch_bytes = 0
+    batch.append(log_event)
+    batch_bytes += event_bytes
+  if batch:
+    yield batch
+
+
+def rejected_log_events(rejected_info: Dict,
+                        batch_size: int) -> Iterator[Tuple[int, str]]:
+  """Yields (index in the batch, reason) for each log event rejected by
+  put_log_events, from its rejectedLogEventsInfo.
+  """
+  too_new_start = rejected_info.get('tooNewLogEventStartIndex', batch_size)
+  too_old_end = rejected_info.get('tooOldLogEventEndIndex', 0)
+  expired_end = rejected_info.get('expiredLogEventEndIndex', 0)
+  for index in range(batch_size):
+    if index >= too_new_start:
+      yield index, 'too new'
+    elif index < expired_end:
+      yield index, 'expired'
+    elif index < too_old_end:
+      yield index, 'too old'
+
+
+def get_logs_client() -> Any:
+  """Returns the Cloudwatch Logs client, creating it on first use.
+  """
+  global _logs_client  # pylint: disable=global-statement
+  if _logs_client is None:
+    _logs_client = botocore.session.get_session().create_client(
+      'logs', config=BOTO_CONFIG)
+  return _logs_client
+
+
+def init() -> None:
+  """Validates the configuration and creates the logs client, so the first
+  invocation doesn't pay for it and misconfiguration fails the init phase.
+  """
+  global _log_group_name  # pylint: disable=global-statement
+  _log_group_name = get_log_group_name()
+  get_logs_client()
+
+
+def create_log_stream(logs: Any, log_group_name: str, log_stream_name: str,
+                      metrics: Optional[Metrics] = None) -> None:
+  """Creates a log stream, unless it already exists, and remembers it.
+  """
+  metrics = metrics or Metrics()
+  try:
+    with metrics.timer('CreateLogStream'):
+      logs.create_log_stream(logGroupName=log_group_name,
+                             logStreamName=log_stream_name)
+  except logs.exceptions.ResourceAlreadyExistsException:
+    # log stream already exists, which is fine
+    pass
+  _known_log_streams.add((log_group_name, log_stream_name))
+
+
+def put_log_events(logs: Any, log_group_name: str, log_stream_name: str,
+                   log_events: List[Dict],
+                   metrics: Optional[Metrics] = None) -> Dict:
+  """Puts log events in a log stream, creating the stream the first time this
+  container sees it, or if it has since been deleted.
+  """
+  metrics = metrics or Metrics()
+  if (log_group_name, log_stream_name) not in _known_log_streams:
+    create_log_stream(logs, log_group_name, log_stream_name, metrics)
+  try:
+    with metrics.timer('PutLogEvents'):
+      return logs.put_log_events(logGroupName=log_group_name,
+                                 logStreamName=log_stream_name,
+                                 logEvents=log_events)
+  except logs.exceptions.ResourceNotFoundException:
+    _known_log_streams.discard((log_group_name, log_stream_name))
+    create_log_stream(logs, log_group_name, log_stream_name, metrics)
+    with metrics.timer('PutLogEvents'):
+      return logs.put_log_events(logGroupName=log_group_name,
+                                 logStreamName=log_stream_name,
+                                 logEvents=log_events)
+
+
+# event: https://docs.aws.amazon.com/lambda/latest/dg/with-sns.html
+# context: https://docs.aws.amazon.com/lambda/latest/dg/python-context.html
+def lambda_handler(event, _) -> None:
+  """Lambda calls this function to do the work.
+  """
+  if _log_group_name is None:
+    init()
+  logs = get_logs_client()
+  log_group_name = _log_group_name
+  metrics = Metrics()
+
+  try:
+    streams = group_records(event['Records'])
+    metrics.add('Records', len(event['Records']))
+    metrics.add('SkippedRecords', len(event['Records'])
+                - sum(len(log_events) for log_events in streams.values()))
+
+    for log_stream_name, log_events in streams.items():
+      for batch in batch_log_events(log_events):
+        # put log events in Cloudwatch Logs
+        response = put_log_events(logs, log_group_name, log_stream_name,
+                                  [log_event for log_event, _ in batch],
+                                  metrics)
+
+        for index, reason in rejected_log_events(
+            response.get('rejectedLogEventsInfo', {}), len(batch)):
+          log_event, record_index = batch[index]
+          metrics.add('RejectedLogEvents')
+          print(f'Log event for record {record_index} was rejected as '
+                f'{reason}: stream {log_stream_name}, '
+                f'timestamp {log_event["timestamp"]}')
+  finally:
+    metrics.emit()
+
+
+# Only at import in Lambda itself, so the module can be imported (e.g. by the
+# unit tests) without the environment set up
+if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+  init()
@@ -0,0 +1,179 @@
+"""Benchmark the cold start of lambda_sns_to_cloudwatch_logs locally.
+
+Each sample runs in a fresh Python process, set up the way Lambda runs the
+function (AWS_LAMBDA_FUNCTION_NAME set, so the module is initialized at
+import):
+- import: the time to import the module, including init(), in a process which
+  has imported nothing else.
+- invoke: the time of the first and second (warm) lambda_handler() calls
+  against moto, with an SNS event of --records records spread over --topics
+  topics. moto has to be imported first, so these processes don't measure
+  import time.
+
+The samples and their percentiles are written to a JSON file. With
+--max-import-ms or --max-first-invocation-ms, exits non-zero if the median is
+slower, so cold start regressions can be caught before deploying.
+
+requires: moto (for the invoke samples)
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from typing import Dict
+from typing import List
+
+MODULE = 'lambda_sns_to_cloudwatch_logs'
+LOG_GROUP_NAME = 'lambda-sns-to-cloudwatch-logs-bench'
+
+# The environment the samples run in
+BENCH_ENVIRONMENT = {
+  'AWS_LAMBDA_FUNCTION_NAME': 'lambda-sns-to-cloudwatch-logs-bench',
+  'AWS_DEFAULT_REGION': 'us-east-1',
+  'AWS_ACCESS_KEY_ID': 'testing',
+  'AWS_SECRET_ACCESS_KEY': 'testing',
+  'CLOUDWATCH_LOG_GROUP_NAME': LOG_GROUP_NAME,
+}
+
+
+def make_event(records: int, topics: int) -> Dict:
+  """Returns an SNS event with the given number of records, round robin over
+  the given number of topics.
+  """
+  timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+  return {'Records': [
+    {
+      'Sns': {
+        'Message': f'bench message {i}',
+        'TopicArn': f'arn:aws:sns:us-east-1:123456789012:bench-{i % topics}',
+        'Timestamp': timestamp,
+      }
+    } for i in range(records)
+  ]}
+
+
+def sample_import() -> Dict:
+  """Measures the module's import time. Runs in a fresh process.
+  """
+  start = time.perf_counter()
+  __import__(MODULE)
+  return {'import_seconds': time.perf_counter() - start}
+
+
+def sample_invoke(records: int, topics: int) -> Dict:
+  """Measures the first and second lambda_handler() calls against moto. Runs
+  in a fresh process.
+  """
+  import moto  # pylint: disable=import-outside-toplevel
+
+  with moto.mock_aws():
+    module = __import__(MODULE)
+    module.get_logs_client().create_log_group(logGroupName=LOG_GROUP_NAME)
+    event = make_event(records, topics)
+    sample = {}
+    for name in ('first_invocation_seconds', 'warm_invocation_seconds'):
+      # the handler prints its metrics, which would corrupt our own output
+      with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        module.lambda_handler(event, None)
+        sample[name] = time.perf_counter() - start
+    return sample
+
+
+def run_sample(args: argparse.Namespace, kind: str) -> Dict:
+  """Runs one sample of the given kind in a fresh process.
+  """
+  command = [sys.executable, os.path.abspath(__file__), '--sample', kind,
+             '--records', str(args.records), '--topics', str(args.topics)]
+  environment = dict(os.environ, **BENCH_ENVIRONMENT)
+  # so the child finds the module next to this script, and nothing else
+  environment['PYTHONPATH'] = os.path.dirname(os.path.abspath(__file__))
+  output = subprocess.run(command, env=environment, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True)
+  return json.loads(output.stdout)
+
+
+def summarize(samples: List[float]) -> Dict:
+  """Returns the median, p90 and max of the samples, in milliseconds.
+  """
+  samples = sorted(sample * 1000 for sample in samples)
+  return {
+    'median_ms': round(statistics.median(samples), 3),
+    'p90_ms': round(samples[min(len(samples) - 1,
+                                int(len(samples) * 0.9))], 3),
+    'max_ms': round(samples[-1], 3),
+  }
+
+
+def main():
+  """Runs the benchmark and writes the results.
+  """
+  parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--samples', type=int, default=10,
+                      help='fresh processes per measurement (default: %(default)s)')
+  parser.add_argument('--records', type=int, default=100,
+                      help='SNS records per event (default: %(default)s)')
+  parser.add_argument('--topics', type=int, default=5,
+                      help='SNS topics per event (default: %(default)s)')
+  parser.add_argument('--max-import-ms', type=float,
+                      help='fail if the median import time is slower')
+  parser.add_argument('--max-first-invocation-ms', type=float,
+                      help='fail if the median first invocation is slower')
+  parser.add_argument('--output', default='lambda_sns_to_cloudwatch_logs_bench.json',
+                      help='default: %(default)s')
+  parser.add_argument('--sample', choices=('import', 'invoke'),
+                      help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.sample == 'import':
+    print(json.dumps(sample_import()))
+    return
+  if args.sample == 'invoke':
+    print(json.dumps(sample_invoke(args.records, args.topics)))
+    return
+
+  samples = [run_sample(args, 'import') for _ in range(args.samples)]
+  samples += [run_sample(args, 'invoke') for _ in range(args.samples)]
+  results = {}
+  for name in ('import', 'first_invocation', 'warm_invocation'):
+    values = [sample[f'{name}_seconds'] for sample in samples
+              if f'{name}_seconds' in sample]
+    results[name] = dict(summarize(values), samples=values)
+    print(f'{name:18} median {results[name]["median_ms"]:8.1f}ms '
+          f'p90 {results[name]["p90_ms"]:8.1f}ms')
+
+  with open(args.output, 'w') as output:
+    json.dump({
+      'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'records': args.records,
+      'topics': args.topics,
+      'results': results,
+    }, output, indent=2)
+    output.write('\n')
+
+  failures = []
+  if args.max_import_ms and results['import']['median_ms'] > args.max_import_ms:
+    failures.append(f'median import {results["import"]["median_ms"]}ms > '
+                    f'{args.max_import_ms}ms')
+  if (args.max_first_invocation_ms and results['first_invocation']['median_ms']
+      > args.max_first_invocation_ms):
+    failures.append(f'median first invocation '
+                    f'{results["first_invocation"]["median_ms"]}ms > '
+                    f'{args.max_first_invocation_ms}ms')
+  if failures:
+    sys.exit(', '.join(failures))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,58 @@
+"""Unittests for aws_inventory
+"""
+import threading
+import unittest
+
+from unittest import mock
+
+import aws_inventory
+
+
+class TestRun(unittest.TestCase):
+  """Test the run() function.
+  """
+  def test_yields_every_row(self):
+    rows = aws_inventory.run(lambda target: ((target, i) for i in range(3)), ['a', 'b'], workers=2)
+    self.assertEqual(sorted(rows), [(target, (target, i)) for target in 'ab' for i in range(3)])
+
+  def test_streams_rows(self):
+    # The first row must arrive while its target is still collecting.
+    release = threading.Event()
+
+    def collect(target):
+      yield 'first'
+      self.assertTrue(release.wait(5))
+      yield 'second'
+
+    rows = aws_inventory.run(collect, ['a'])
+    self.assertEqual(next(rows), ('a', 'first'))
+    release.set()
+    self.assertEqual(list(rows), [('a', 'second')])
+
+  @mock.patch.object(aws_inventory, 'RUN_QUEUE_SIZE', 2)
+  def test_bounded_buffer(self):
+    produced = []
+
+    def collect(target):
+      for i in range(100):
+        produced.append(i)
+        yield i
+
+    rows = aws_inventory.run(collect, ['a'])
+    self.assertEqual(next(rows), ('a', 0))
+    rows.close()
+    # collect() was held back by the full queue, then stopped when the consumer went away
+    self.assertLess(len(produced), 10)
+
+  def test_raises_collect_errors(self):
+    def collect(target):
+      yield 'row'
+      if target == 'bad':
+        raise ValueError(target)
+
+    with self.assertRaisesRegex(ValueError, 'bad'):
+      list(aws_inventory.run(collect, ['good', 'bad']))
+
+
+if __name__ == '__main__':
+  unittest.main()
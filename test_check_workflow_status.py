@@ -0,0 +1,502 @@
+"""Unittests for check_workflow_status
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+import requests  # pylint: disable=import-error
+
+import check_workflow_status
+
+
+def make_response(status_code: int, body: dict = None,
+                  headers: dict = None) -> mock.Mock:
+    """Return a fake requests.Response."""
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.json.return_value = body
+    if body is None:
+        response.json.side_effect = ValueError('not JSON')
+    return response
+
+
+class TestApiGet(unittest.TestCase):
+    """Test the _api_get() function."""
+
+    def setUp(self):
+        self.session = mock.Mock()
+        for patcher in (
+                mock.patch.object(check_workflow_status, '_get_session',
+                                  return_value=self.session),
+                mock.patch.object(check_workflow_status, '_DEADLINE', None),
+                mock.patch('time.sleep')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_returns_json(self):
+        self.session.get.return_value = make_response(200, {'items': []})
+        self.assertEqual(check_workflow_status._api_get('url', {'a': 1}),
+                         {'items': []})
+        self.session.get.assert_called_once_with(
+            'url', params={'a': 1}, timeout=check_workflow_status.HTTP_TIMEOUT)
+
+    def test_retries(self):
+        self.session.get.side_effect = [
+            make_response(503),
+            requests.ConnectionError('reset'),
+            make_response(429, headers={'Retry-After': '3'}),
+            make_response(200, {'items': []})]
+        self.assertEqual(check_workflow_status._api_get('url'), {'items': []})
+        self.assertEqual(time.sleep.call_args_list[-1], mock.call(3.0))
+
+    def test_retries_run_out(self):
+        self.session.get.return_value = make_response(502)
+        with self.assertRaisesRegex(check_workflow_status.CircleCIError,
+                                    'failed 8 times, last with HTTP 502'):
+            check_workflow_status._api_get('url')
+        self.assertEqual(self.session.get.call_count,
+                         check_workflow_status.MAX_API_RETRIES)
+
+    def test_not_json(self):
+        self.session.get.return_value = make_response(404)
+        with self.assertRaisesRegex(check_workflow_status.CircleCIError,
+                                    'returned HTTP 404, not JSON'):
+            check_workflow_status._api_get('url')
+
+    def test_deadline_passed(self):
+        with mock.patch.object(check_workflow_status, '_DEADLINE',
+                               time.monotonic() - 1):
+            with self.assertRaisesRegex(check_workflow_status.CircleCIError,
+                                        'Timed out'):
+                check_workflow_status._api_get('url')
+        self.session.get.assert_not_called()
+
+    def test_retry_after_past_deadline(self):
+        self.session.get.return_value = make_response(
+            429, headers={'Retry-After': '60'})
+        with mock.patch.object(check_workflow_status, '_DEADLINE',
+                               time.monotonic() + 10):
+            with self.assertRaisesRegex(check_workflow_status.CircleCIError,
+                                        'Timed out'):
+                check_workflow_status._api_get('url')
+        time.sleep.assert_not_called()
+
+
+class FakePipelineApi:
+    """A stand-in for the CircleCI list pipelines endpoint, 20 per page."""
+
+    def __init__(self):
+        self.items = []
+        self.calls = 0
+
+    def add(self, count: int, days_old: float = 0) -> None:
+        """Add count new pipelines, created days_old days ago."""
+        created_at = (datetime.datetime.now(datetime.timezone.utc)
+                      - datetime.timedelta(days=days_old)).isoformat()
+        for _ in range(count):
+            number = len(self.items) + 1
+            self.items.insert(0, {'id': f'id{number}', 'number': number,
+                                  'vcs': {'revision': f'c{number}'},
+                                  'created_at': created_at})
+
+    def get(self, url: str, params: dict = None) -> dict:
+        """Return a page of pipelines, newest first."""
+        del url
+        self.calls += 1
+        start = int(params.get('page-token', 0))
+        end = start + 20
+        return {'items': self.items[start:end],
+                'next_page_token': str(end) if end < len(self.items) else None}
+
+
+class TestGetPipelineFromCommit(unittest.TestCase):
+    """Test the _get_pipeline_from_commit() function and its index."""
+
+    def setUp(self):
+        self.api = FakePipelineApi()
+        patcher = mock.patch.object(check_workflow_status, '_api_get',
+                                    self.api.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = {}
+
+    def find(self, commit: str, **limits) -> dict:
+        self.api.calls = 0
+        return check_workflow_status._get_pipeline_from_commit(
+            'gh/org/project', 'main', commit, self.index, **limits)
+
+    def test_hit(self):
+        self.api.add(100)
+        self.assertEqual(self.find('c50'), {'id': 'id50', 'number': 50})
+        self.assertEqual(self.api.calls, 3)
+        self.assertEqual(self.find('c50'), {'id': 'id50', 'number': 50})
+        self.assertEqual(self.api.calls, 0)
+
+    def test_miss(self):
+        self.api.add(100)
+        self.assertIsNone(self.find('missing'))
+        self.assertEqual(self.api.calls, 5)
+        self.assertEqual(len(self.index['pipelines']), 100)
+
+    def test_catch_up_after_page_limit(self):
+        self.api.add(1000)
+        self.assertIsNone(self.find('missing', max_pages=10))
+        self.assertEqual(self.api.calls, 10)
+        # a miss only pages through the pipelines created since
+        self.api.add(30)
+        self.assertIsNone(self.find('missing', max_pages=10))
+        self.assertEqual(self.api.calls, 2)
+        self.assertIsNone(self.find('missing', max_pages=10))
+        self.assertEqual(self.api.calls, 1)
+        self.api.add(1)
+        self.assertEqual(self.find('c1031', max_pages=10)['number'], 1031)
+        self.assertEqual(self.api.calls, 1)
+
+    def test_catch_up_after_age_limit(self):
+        self.api.add(100, days_old=100)
+        self.api.add(100, days_old=10)
+        self.assertIsNone(self.find('missing', max_age=90))
+        self.assertEqual(self.api.calls, 6)
+        self.api.add(5)
+        self.assertIsNone(self.find('missing', max_age=90))
+        self.assertEqual(self.api.calls, 1)
+
+    def test_catch_up_after_hit(self):
+        self.api.add(100)
+        self.assertIsNone(self.find('missing', max_pages=2))
+        # found before reaching the pipelines known from the last miss, so
+        # the next miss still pages down to those
+        self.api.add(100)
+        self.assertEqual(self.find('c200')['number'], 200)
+        self.assertIsNone(self.find('missing', max_pages=10))
+        self.assertEqual(self.api.calls, 6)
+
+
+class FakeCircleCI:
+    """A stand-in for every CircleCI endpoint check_workflow_status uses.
+    Each pipeline reports its workflow statuses one poll at a time, repeating
+    the last poll once they run out."""
+
+    def __init__(self):
+        self.pipelines = {}
+        self.polls = {}
+        self.jobs = {}
+        self.calls = []
+
+    def add(self, project_slug: str, commit: str, *polls: list) -> None:
+        """Add the pipeline for a commit, whose workflows have the given
+        statuses on each poll. Workflow ids are commit-w0, commit-w1..."""
+        items = self.pipelines.setdefault(project_slug, [])
+        number = len(items) + 1
+        items.insert(0, {'id': f'{commit}-p', 'number': number,
+                         'vcs': {'revision': commit},
+                         'created_at': '2026-10-18T00:00:00Z'})
+        self.polls[f'{commit}-p'] = [
+            {'items': [{'id': f'{commit}-w{i}', 'status': status}
+                       for i, status in enumerate(statuses)]}
+            for statuses in polls]
+
+    def get(self, url: str, params: dict = None) -> dict:
+        """Answer an API request."""
+        del params
+        path = url[len(check_workflow_status.CIRCLE_API_ENDPOINT):]
+        self.calls.append(path)
+        prefix, name, endpoint = path.rsplit('/', 2)
+        if endpoint == 'pipeline':
+            project_slug = path[len('/project/'):-len('/pipeline')]
+            if project_slug not in self.pipelines:
+                return {'message': 'Project not found'}
+            return {'items': self.pipelines[project_slug],
+                    'next_page_token': None}
+        if endpoint == 'workflow':
+            polls = self.polls[name]
+            return polls.pop(0) if len(polls) > 1 else polls[0]
+        assert prefix == '/workflow' and endpoint == 'job', path
+        return {'items': self.jobs.get(name, []), 'next_page_token': None}
+
+
+class TestTargets(unittest.TestCase):
+    """Test --targets mode: main_targets(), _watch_targets() and
+    _read_targets()."""
+
+    def setUp(self):
+        self.api = FakeCircleCI()
+        for patcher in (
+                mock.patch.object(check_workflow_status, '_api_get',
+                                  self.api.get),
+                mock.patch.object(check_workflow_status, '_RATE_LIMITER',
+                                  None),
+                mock.patch.object(check_workflow_status, '_DEADLINE', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.args = {'--targets': os.path.join(self.directory, 'targets'),
+                     '--index': os.path.join(self.directory, 'index.json'),
+                     '--rate': '100', '--timeout': '0', '--max-pages': '5',
+                     '--max-age': '0', '--min-poll': '0', '--max-poll': '0',
+                     '--fail-fast': False}
+
+    def run_targets(self, *targets: str) -> tuple:
+        """Run main_targets() on the given target lines, returning the
+        printed lines sorted, and the SystemExit message or None."""
+        with open(self.args['--targets'], 'w',
+                  encoding='utf-8') as targets_file:
+            targets_file.write(''.join(f'{target}\n' for target in targets))
+        output = io.StringIO()
+        status = None
+        with contextlib.redirect_stdout(output):
+            try:
+                check_workflow_status.main_targets(self.args)
+            except SystemExit as error:
+                status = str(error)
+        return sorted(output.getvalue().splitlines()), status
+
+    def test_all_succeed(self):
+        self.api.add('gh/org/one', 'c1', ['running'], ['success'])
+        self.api.add('gh/org/two', 'c2', ['success', 'not_run'])
+        self.assertEqual(self.run_targets('gh/org/one main c1',
+                                          'gh/org/two main c2'), ([
+            'gh/org/one main c1: success '
+            'https://app.circleci.com/pipelines/gh/org/one/1',
+            'gh/org/two main c2: success '
+            'https://app.circleci.com/pipelines/gh/org/two/1'], None))
+
+    def test_failures_dont_stop_other_targets(self):
+        self.api.add('gh/org/one', 'c1', ['running'], ['running'],
+                     ['success'])
+        self.api.add('gh/org/two', 'c2', ['running'], ['failed'])
+        lines, status = self.run_targets('gh/org/missing main c0',
+                                         'gh/org/one main c1',
+                                         'gh/org/two main c2',
+                                         'gh/org/two main nope')
+        self.assertEqual(lines, [
+            "gh/org/missing main c0: ERROR: CircleCI says: "
+            "{'message': 'Project not found'}",
+            'gh/org/one main c1: success '
+            'https://app.circleci.com/pipelines/gh/org/one/1',
+            "gh/org/two main c2: failed "
+            "https://app.circleci.com/pipelines/gh/org/two/1 ['c2-w0']",
+            'gh/org/two main nope: ERROR: Could not find commit'])
+        self.assertEqual(status, '3 of 4 pipelines did not succeed')
+        # the index is saved even though some targets failed
+        index = check_workflow_status._load_pipeline_index(
+            self.args['--index'])
+        self.assertIn('c1', index['gh/org/one']['main']['pipelines'])
+
+    def test_index_saved_on_error(self):
+        self.api.add('gh/org/one', 'c1', ['success'])
+        with mock.patch.object(check_workflow_status, '_watch_targets',
+                               side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_targets('gh/org/one main c1')
+        self.assertTrue(os.path.exists(self.args['--index']))
+
+    def test_timeout(self):
+        self.api.add('gh/org/one', 'c1', ['running'])
+        self.api.add('gh/org/two', 'c2', ['success'])
+        self.args['--timeout'] = '0.05'
+        lines, status = self.run_targets('gh/org/one main c1',
+                                         'gh/org/two main c2')
+        self.assertEqual(lines[0], 'gh/org/one main c1: ERROR: Timed out '
+                         'https://app.circleci.com/pipelines/gh/org/one/1')
+        self.assertTrue(lines[1].startswith('gh/org/two main c2: success'))
+        self.assertEqual(status, '1 of 2 pipelines did not succeed')
+
+    def test_shared_branch_index(self):
+        self.api.add('gh/org/one', 'c1', ['success'])
+        self.api.add('gh/org/one', 'c2', ['success'])
+        self.assertEqual(self.run_targets('gh/org/one main c1',
+                                          'gh/org/one main c2')[1], None)
+        # the second lookup is answered by the index the first one filled
+        self.assertEqual(self.api.calls.count('/project/gh/org/one/pipeline'),
+                         1)
+
+    def test_read_targets(self):
+        path = os.path.join(self.directory, 'targets')
+        with open(path, 'w', encoding='utf-8') as targets_file:
+            targets_file.write('# slug branch commit\n\n'
+                               'gh/org/one main c1\n'
+                               '  bb/org/two  feature  c2  \n')
+        self.assertEqual(check_workflow_status._read_targets(path),
+                         [('gh/org/one', 'main', 'c1'),
+                          ('bb/org/two', 'feature', 'c2')])
+
+    def test_read_targets_stdin(self):
+        with mock.patch('sys.stdin', io.StringIO('gh/org/one main c1\n')):
+            self.assertEqual(check_workflow_status._read_targets('-'),
+                             [('gh/org/one', 'main', 'c1')])
+
+    def test_read_targets_malformed(self):
+        for line in ('gh/org/one main', 'org/one main c1'):
+            with mock.patch('sys.stdin', io.StringIO(f'{line}\n')):
+                with self.assertRaisesRegex(SystemExit, line):
+                    check_workflow_status._read_targets('-')
+
+
+class TestFailFast(unittest.TestCase):
+    """Test --fail-fast: _failed_jobs(), _running_workflow_ids() and the
+    early exits in main() and --targets mode."""
+
+    def setUp(self):
+        self.api = FakeCircleCI()
+        for patcher in (
+                mock.patch.object(check_workflow_status, '_api_get',
+                                  self.api.get),
+                mock.patch.object(check_workflow_status, '_RATE_LIMITER',
+                                  None),
+                mock.patch.object(check_workflow_status, '_DEADLINE', None),
+                mock.patch('time.sleep')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.args = {'--vcs': 'gh', '--org': 'org', '--project': 'one',
+                     '--branch': 'main', '--commit': 'c1',
+                     '--index': os.path.join(directory.name, 'index.json'),
+                     '--timeout': '0', '--max-pages': '5', '--max-age': '0',
+                     '--min-poll': '1', '--max-poll': '1',
+                     '--fail-fast': True}
+
+    def main(self) -> str:
+        """Run main(), returning its SystemExit message or None."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                check_workflow_status.main(self.args)
+            except SystemExit as error:
+                return str(error)
+        return None
+
+    def test_failed_jobs(self):
+        jobs = [{'name': 'build', 'status': 'success', 'job_number': 1},
+                {'name': 'test', 'status': 'failed', 'job_number': 2},
+                {'name': 'lint', 'status': 'running', 'job_number': 3},
+                {'name': 'deploy', 'status': 'canceled'}]
+        self.assertEqual(
+            check_workflow_status._failed_jobs('url', 'w1', jobs),
+            ['test url/workflows/w1/jobs/2', 'deploy url/workflows/w1/jobs/'])
+
+    def test_running_workflow_ids(self):
+        workflows = {'items': [{'id': f'w{i}', 'status': status}
+                               for i, status in enumerate((
+                                   'running', 'failing', 'on_hold',
+                                   'success', 'failed'))]}
+        self.assertEqual(
+            check_workflow_status._running_workflow_ids(workflows),
+            ['w0', 'w1'])
+
+    def test_exits_at_failed_job(self):
+        self.api.add('gh/org/one', 'c1', ['running'])
+        self.api.jobs['c1-w0'] = [{'name': 'test', 'status': 'failed',
+                                   'job_number': 7}]
+        self.assertEqual(
+            self.main(), "The following jobs failed: ['test https://app."
+            "circleci.com/pipelines/gh/org/one/1/workflows/c1-w0/jobs/7']")
+        self.assertEqual(self.api.calls.count('/pipeline/c1-p/workflow'), 1)
+
+    def test_waits_for_running_jobs(self):
+        self.api.add('gh/org/one', 'c1', ['running'], ['running'],
+                     ['success'])
+        self.api.jobs['c1-w0'] = [{'name': 'test', 'status': 'running'}]
+        self.assertIsNone(self.main())
+        self.assertEqual(self.api.calls.count('/workflow/c1-w0/job'), 2)
+
+    def test_exits_at_failing_workflow(self):
+        # w0 already has a failed job, while w1 is still running
+        self.api.add('gh/org/one', 'c1', ['failing', 'running'])
+        self.api.jobs['c1-w0'] = [{'name': 'test', 'status': 'failed',
+                                   'job_number': 7},
+                                  {'name': 'slow', 'status': 'running'}]
+        self.assertRegex(self.main(), 'The following jobs failed: '
+                         r"\['test .*/workflows/c1-w0/jobs/7'\]")
+        self.assertEqual(self.api.calls.count('/pipeline/c1-p/workflow'), 1)
+
+    def test_exits_at_failed_workflow(self):
+        self.api.add('gh/org/one', 'c1', ['failed', 'running'])
+        self.assertEqual(self.main(),
+                         "The following workflows failed: ['c1-w0']")
+        self.assertEqual(self.api.calls.count('/pipeline/c1-p/workflow'), 1)
+
+    def test_without_fail_fast(self):
+        self.args['--fail-fast'] = False
+        self.api.add('gh/org/one', 'c1', ['failing', 'running'],
+                     ['failed', 'running'], ['failed', 'success'])
+        self.assertEqual(self.main(),
+                         "The following workflows failed: ['c1-w0']")
+        self.assertEqual(self.api.calls.count('/pipeline/c1-p/workflow'), 3)
+        self.assertNotIn('/workflow/c1-w0/job', self.api.calls)
+
+    def test_targets(self):
+        self.api.add('gh/org/one', 'c1', ['failing', 'running'])
+        self.api.jobs['c1-w0'] = [{'name': 'test', 'status': 'failed',
+                                   'job_number': 7}]
+        self.api.add('gh/org/two', 'c2', ['failed', 'running'])
+        self.api.add('gh/org/three', 'c3', ['running'], ['success'])
+        self.args['--min-poll'] = self.args['--max-poll'] = '0'
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = asyncio.run(check_workflow_status._watch_targets(
+                [('gh/org/one', 'main', 'c1'), ('gh/org/two', 'main', 'c2'),
+                 ('gh/org/three', 'main', 'c3')], {}, self.args, None))
+        self.assertEqual(results, [False, False, True])
+        self.assertEqual(sorted(output.getvalue().splitlines()), [
+            "gh/org/one main c1: failed "
+            "https://app.circleci.com/pipelines/gh/org/one/1 ['test https://"
+            "app.circleci.com/pipelines/gh/org/one/1/workflows/c1-w0/jobs/7']",
+            'gh/org/three main c3: success '
+            'https://app.circleci.com/pipelines/gh/org/three/1',
+            "gh/org/two main c2: failed "
+            "https://app.circleci.com/pipelines/gh/org/two/1 ['c2-w0']"])
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test the _RateLimiter class."""
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.monotonic', return_value=100.0)
+    def test_spaces_requests(self, monotonic, sleep):
+        limiter = check_workflow_status._RateLimiter(10)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual([round(call.args[0], 6)
+                          for call in sleep.call_args_list], [0, 0.1, 0.2])
+        # once the slots have passed, there's no wait
+        monotonic.return_value = 101.0
+        limiter.wait()
+        self.assertEqual(sleep.call_args.args[0], 0)
+
+
+class TestSavePipelineIndex(unittest.TestCase):
+    """Test the _save_pipeline_index() and _load_pipeline_index()
+    functions."""
+
+    @mock.patch.object(check_workflow_status, 'INDEX_MAX_PIPELINES', 3)
+    def test_keeps_newest_pipelines(self):
+        branch_index = {'newest': 5, 'searched': True, 'pipelines': {
+            f'c{number}': {'id': f'id{number}', 'number': number}
+            for number in (4, 1, 5, 2, 3)}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache', 'index.json')
+            check_workflow_status._save_pipeline_index(
+                path, {'gh/org/project': {'main': branch_index}})
+            index = check_workflow_status._load_pipeline_index(path)
+        self.assertEqual(
+            index['gh/org/project']['main'],
+            {'newest': 5, 'searched': True, 'pipelines': {
+                f'c{number}': {'id': f'id{number}', 'number': number}
+                for number in (3, 4, 5)}})
+
+    def test_missing_file(self):
+        self.assertEqual(
+            check_workflow_status._load_pipeline_index('/nonexistent'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
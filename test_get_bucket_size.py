@@ -0,0 +1,217 @@
+"""Unittests for get-bucket-size
+"""
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from unittest import mock
+
+import boto3
+
+try:
+  import moto
+except ImportError:  # moto is only needed to fake S3 and CloudWatch
+  moto = None
+
+# The script's name isn't a valid module name, so load it from its path.
+_spec = importlib.util.spec_from_file_location(
+  'get_bucket_size', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'get-bucket-size.py'))
+get_bucket_size = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(get_bucket_size)
+
+
+class TestBucketCache(unittest.TestCase):
+  """Test the BucketCache class.
+  """
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = os.path.join(directory.name, 'cache.sqlite')
+    self.now = 1700000000.0
+    patcher = mock.patch('time.time', lambda: self.now)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.cache = self.open_cache('111111111111')
+
+  def open_cache(self, account):
+    cache = get_bucket_size.BucketCache(self.path, account)
+    self.addCleanup(cache.db.close)
+    return cache
+
+  def test_regions_ttl(self):
+    self.cache.put_regions({'a': 'us-east-1', 'b': 'eu-west-1'})
+    self.assertEqual(self.cache.get_regions(['a', 'b', 'c']), {'a': 'us-east-1', 'b': 'eu-west-1'})
+    self.now += get_bucket_size.CACHE_TTL_REGION - 1
+    self.assertEqual(self.cache.get_regions(['a']), {'a': 'us-east-1'})
+    self.now += 2
+    self.assertEqual(self.cache.get_regions(['a', 'b']), {})
+
+  def test_storage_types_ttl(self):
+    self.cache.put_storage_types({'a': {'StandardStorage', 'GlacierStorage'}, 'b': set()})
+    self.assertEqual(self.cache.get_storage_types(['a', 'b']),
+                     {'a': {'StandardStorage', 'GlacierStorage'}, 'b': set()})
+    self.now += get_bucket_size.CACHE_TTL_STORAGE_TYPES - 1
+    self.assertEqual(self.cache.get_storage_types(['b']), {'b': set()})
+    self.now += 2
+    self.assertEqual(self.cache.get_storage_types(['a', 'b']), {})
+
+  def test_sizes_ttl(self):
+    self.cache.put_sizes({'a': 100.0, 'b': 0}, '2026-10-15')
+    self.assertEqual(self.cache.get_sizes(['a', 'b'], '2026-10-15'), {'a': 100.0, 'b': 0})
+    self.now += get_bucket_size.CACHE_TTL_SIZE - 1
+    self.assertEqual(self.cache.get_sizes(['a'], '2026-10-15'), {'a': 100.0})
+    self.now += 2
+    self.assertEqual(self.cache.get_sizes(['a', 'b'], '2026-10-15'), {})
+
+  def test_sizes_keyed_by_day(self):
+    self.cache.put_sizes({'a': 100.0}, '2026-10-15')
+    self.assertEqual(self.cache.get_sizes(['a'], '2026-10-16'), {})
+    self.cache.put_sizes({'a': 200.0}, '2026-10-16')
+    self.assertEqual(self.cache.get_sizes(['a'], '2026-10-15'), {'a': 100.0})
+    self.assertEqual(self.cache.get_sizes(['a'], '2026-10-16'), {'a': 200.0})
+
+  def test_keyed_by_account(self):
+    self.cache.put_regions({'a': 'us-east-1'})
+    self.assertEqual(self.open_cache('222222222222').get_regions(['a']), {})
+    self.assertEqual(self.open_cache('111111111111').get_regions(['a']), {'a': 'us-east-1'})
+
+
+class TestPositiveInt(unittest.TestCase):
+  """Test the positive_int() argparse type.
+  """
+  def test_positive(self):
+    self.assertEqual(get_bucket_size.positive_int('3'), 3)
+
+  def test_not_positive(self):
+    for text in ('0', '-1'):
+      with self.assertRaises(argparse.ArgumentTypeError):
+        get_bucket_size.positive_int(text)
+
+
+class MainTestCase(unittest.TestCase):
+  """Base class for running main() against moto, with two buckets and their BucketSizeBytes metrics.
+  """
+  def setUp(self):
+    patcher = mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                                           'AWS_SECRET_ACCESS_KEY': 'testing'})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    mock_aws = moto.mock_aws()
+    mock_aws.start()
+    self.addCleanup(mock_aws.stop)
+    get_bucket_size._cloudwatch_clients.clear()
+    self.addCleanup(get_bucket_size._cloudwatch_clients.clear)
+
+    # Count every CloudWatch API call made by clients created from here on.
+    self.cloudwatch_calls = []
+    boto3.setup_default_session()
+    self.addCleanup(setattr, boto3, 'DEFAULT_SESSION', None)
+    boto3.DEFAULT_SESSION.events.register(
+      'before-call.cloudwatch', lambda model, **kwargs: self.cloudwatch_calls.append(model.name))
+
+    s3 = boto3.client('s3')
+    cloudwatch = boto3.client('cloudwatch')
+    timestamp = get_bucket_size.get_metric_window()[0] + datetime.timedelta(hours=12)
+    for bucket_name, size in (('bucket-a', 100), ('bucket-b', 7)):
+      s3.create_bucket(Bucket=bucket_name)
+      cloudwatch.put_metric_data(Namespace='AWS/S3', MetricData=[{
+        'MetricName': 'BucketSizeBytes',
+        'Dimensions': [{'Name': 'BucketName', 'Value': bucket_name}, {'Name': 'StorageType', 'Value': 'StandardStorage'}],
+        'Timestamp': timestamp,
+        'Value': size,
+      }])
+    self.cloudwatch_calls.clear()
+
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.args = argparse.Namespace(workers=2, cache=os.path.join(directory.name, 'cache.sqlite'), no_cache=False,
+                                   top=None, stream=False)
+
+  def run_main(self):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      get_bucket_size.main(self.args)
+    return output.getvalue()
+
+
+@unittest.skipIf(moto is None, 'moto is not installed')
+class TestMainCache(MainTestCase):
+  """Test that main() answers from the cache.
+  """
+
+  def test_rerun_makes_no_cloudwatch_calls(self):
+    self.assertEqual(self.run_main(), '7.0\tbucket-b\n100.0\tbucket-a\n')
+    self.assertIn('GetMetricData', self.cloudwatch_calls)
+    self.cloudwatch_calls.clear()
+    self.assertEqual(self.run_main(), '7.0\tbucket-b\n100.0\tbucket-a\n')
+    self.assertEqual(self.cloudwatch_calls, [])
+
+  def storage_types_updated(self):
+    with contextlib.closing(sqlite3.connect(self.args.cache)) as db:
+      return dict(db.execute('SELECT bucket, updated FROM bucket_storage_types'))
+
+  def age_cache(self, table, seconds):
+    with contextlib.closing(sqlite3.connect(self.args.cache)) as db, db:
+      db.execute('UPDATE {} SET updated = updated - ?'.format(table), (seconds,))
+
+  def test_cached_storage_types_expire(self):
+    self.run_main()
+    updated = self.storage_types_updated()
+    self.assertEqual(set(updated), {'bucket-a', 'bucket-b'})
+
+    # Refreshing sizes from cached storage types leaves their age alone...
+    self.age_cache('bucket_size', get_bucket_size.CACHE_TTL_SIZE)
+    self.cloudwatch_calls.clear()
+    self.assertEqual(self.run_main(), '7.0\tbucket-b\n100.0\tbucket-a\n')
+    self.assertEqual(self.cloudwatch_calls, ['GetMetricData'])
+    self.assertEqual(self.storage_types_updated(), updated)
+
+    # ...so they still expire, and are discovered again.
+    self.age_cache('bucket_size', get_bucket_size.CACHE_TTL_SIZE)
+    self.age_cache('bucket_storage_types', get_bucket_size.CACHE_TTL_STORAGE_TYPES)
+    self.cloudwatch_calls.clear()
+    self.run_main()
+    self.assertEqual(self.cloudwatch_calls, ['ListMetrics', 'GetMetricData'])
+    self.assertGreater(min(self.storage_types_updated().values()), max(updated.values()))
+
+  def test_no_cache(self):
+    self.args.no_cache = True
+    self.run_main()
+    self.cloudwatch_calls.clear()
+    self.run_main()
+    self.assertIn('GetMetricData', self.cloudwatch_calls)
+    self.assertFalse(os.path.exists(self.args.cache))
+
+
+@unittest.skipIf(moto is None, 'moto is not installed')
+class TestMainReports(MainTestCase):
+  """Test the --top and --stream reports of main().
+  """
+  def test_top(self):
+    self.args.top = 1
+    errors = io.StringIO()
+    for _ in range(2):  # fetched, then from the cache
+      with contextlib.redirect_stderr(errors):
+        self.assertEqual(self.run_main(), '100.0\tbucket-a\n')
+    # progress is only written as regions complete, and the second run has nothing left to fetch
+    self.assertEqual(errors.getvalue(), '# top 1 after us-east-1: bucket-a=100.0\n')
+
+  def test_stream(self):
+    self.args.stream = True
+    for _ in range(2):  # fetched, then from the cache
+      rows = [json.loads(line) for line in self.run_main().splitlines()]
+      self.assertEqual(sorted(rows, key=lambda row: row['bucket']), [
+          {'bucket': 'bucket-a', 'size': 100.0, 'region': 'us-east-1'},
+          {'bucket': 'bucket-b', 'size': 7.0, 'region': 'us-east-1'},
+      ])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,238 @@
+"""Unittests for krypto_hw
+"""
+import fractions
+import itertools
+import operator
+import os
+import tempfile
+import unittest
+
+import krypto_hw
+
+
+class TestTupleMath(unittest.TestCase):
+  """Test the tuple_math() function.
+  """
+  def test_left_to_right(self):
+    self.assertEqual(
+      krypto_hw.tuple_math((1, 3, 7), (operator.add, operator.sub)), -3)
+
+  def test_single_number(self):
+    self.assertEqual(krypto_hw.tuple_math((7,), ()), 7)
+
+  def test_exact_division(self):
+    result = krypto_hw.tuple_math((7, 3, 3), (operator.truediv, operator.mul))
+    self.assertIsInstance(result, fractions.Fraction)
+    self.assertEqual(result, 7)
+
+  def test_raises_exception(self):
+    self.assertRaises(krypto_hw.ErrorWrongNumberOfOperators,
+                      krypto_hw.tuple_math, (1, 3, 7), (operator.add,))
+
+
+class TestReachableValues(unittest.TestCase):
+  """Test the reachable_values() function.
+  """
+  def setUp(self):
+    self.nums = [2, 3, 5]
+    self.values = krypto_hw.reachable_values(self.nums)
+
+  def test_table_size(self):
+    self.assertEqual(len(self.values), 2 ** len(self.nums))
+
+  def test_single_numbers(self):
+    self.assertEqual(self.values[0b001], {2})
+    self.assertEqual(self.values[0b010], {3})
+    self.assertEqual(self.values[0b100], {5})
+
+  def test_pairs(self):
+    self.assertEqual(self.values[0b011], {5, -1, 1, 6, fractions.Fraction(2, 3),
+                                          fractions.Fraction(3, 2)})
+
+  def test_all_parenthesizations(self):
+    # 2 * (3 + 5) is only reachable with the parenthesis on the right
+    self.assertIn(16, self.values[0b111])
+
+  def test_division_by_zero_skipped(self):
+    values = krypto_hw.reachable_values([3, 3, 1])
+    self.assertIn(0, values[0b011])
+    self.assertNotIn(float('inf'), values[0b111])
+
+
+class TestCanonical(unittest.TestCase):
+  """Test the canonical() and render() functions.
+  """
+  def setUp(self):
+    self.a, self.b, self.c = (('n', fractions.Fraction(x)) for x in (1, 2, 3))
+
+  def test_commutative(self):
+    self.assertEqual(krypto_hw.canonical(operator.add, self.a, self.b),
+                     krypto_hw.canonical(operator.add, self.b, self.a))
+
+  def test_flattens_subtraction(self):
+    # a - (b - c) == a + c - b
+    self.assertEqual(
+      krypto_hw.canonical(operator.sub, self.a,
+                          krypto_hw.canonical(operator.sub, self.b, self.c)),
+      krypto_hw.canonical(operator.sub,
+                          krypto_hw.canonical(operator.add, self.a, self.c),
+                          self.b))
+
+  def test_not_commutative(self):
+    self.assertNotEqual(krypto_hw.canonical(operator.truediv, self.a, self.b),
+                        krypto_hw.canonical(operator.truediv, self.b, self.a))
+
+  def test_render_parenthesis(self):
+    expression = krypto_hw.canonical(
+      operator.mul, krypto_hw.canonical(operator.sub, self.c, self.a), self.b)
+    self.assertEqual(krypto_hw.render(expression), '2 * (3 - 1)')
+
+
+class TestSolveSubsets(unittest.TestCase):
+  """Test the solve_subsets() function.
+  """
+  def test_expressions_hit_target(self):
+    for expression in krypto_hw.solve_subsets([1, 3, 7, 16, 24], 11, [3, 4, 5]):
+      self.assertAlmostEqual(eval(expression), 11)  # pylint: disable=eval-used
+
+  def test_exact_solution(self):
+    # 8 / (3 - 8 / 3) is 23.999999999999993 in floating point
+    self.assertEqual(list(krypto_hw.solve_subsets([8, 3, 8, 3], 24, [4])),
+                     ['8 / (3 - 8 / 3)'])
+
+  def test_each_solution_once(self):
+    self.assertEqual(sorted(krypto_hw.solve_subsets([1, 2, 3], 6, [3])),
+                     ['3 * 2 * 1', '3 * 2 / 1', '3 + 2 + 1'])
+
+  def test_repeated_numbers(self):
+    solutions = list(krypto_hw.solve_subsets([3, 3, 3], 6, [2]))
+    self.assertEqual(solutions, ['3 + 3'])
+
+  def test_sizes(self):
+    for expression in krypto_hw.solve_subsets([1, 3, 7, 16, 24], 11, [3]):
+      self.assertEqual(len(expression.split()), 5)
+
+  def test_finds_grouping_brute_force_misses(self):
+    nums = [2, 3, 5, 7]
+    brute = [ops for perm in itertools.permutations(nums)
+             for ops in itertools.product(krypto_hw.MATH_OPS, repeat=3)
+             if krypto_hw.tuple_math(perm, ops) == 41]
+    self.assertEqual(brute, [])
+    self.assertIn('7 * 5 + 3 * 2',
+                  list(krypto_hw.solve_subsets(nums, 41, [4])))
+
+  def test_no_solution(self):
+    self.assertEqual(list(krypto_hw.solve_subsets([1, 2], 100, [2])), [])
+
+
+class TestSolve(unittest.TestCase):
+  """Test the solve() function.
+  """
+  def setUp(self):
+    self.nums = [1, 3, 7, 16, 24]
+    self.sizes = [3, 4]
+
+  def test_output_type(self):
+    solution = next(krypto_hw.solve(self.nums, 11, self.sizes))
+    self.assertIsInstance(solution, krypto_hw.Solution)
+    self.assertEqual(str(solution), f'{solution.expression} = 11')
+    self.assertIn(len(solution.numbers), self.sizes)
+
+  def test_limit(self):
+    self.assertEqual(len(list(krypto_hw.solve(self.nums, 11, self.sizes, limit=2))), 2)
+    self.assertEqual(list(krypto_hw.solve(self.nums, 11, self.sizes, limit=0)), [])
+
+  def test_workers_find_same_solutions(self):
+    sequential = {solution.expression for solution in krypto_hw.solve(self.nums, 11, self.sizes)}
+    parallel = [solution.expression for solution in krypto_hw.solve(self.nums, 11, self.sizes, workers=2)]
+    self.assertEqual(len(parallel), len(set(parallel)))
+    self.assertEqual(set(parallel), sequential)
+
+  def test_workers_split_one_subset(self):
+    # all of nums is a single subset, which is split across the workers
+    sequential = {solution.expression for solution in krypto_hw.solve(self.nums, 11, [5])}
+    parallel = [solution.expression for solution in krypto_hw.solve(self.nums, 11, [5], workers=2, chunk_size=1)]
+    self.assertEqual(len(parallel), len(set(parallel)))
+    self.assertEqual(set(parallel), sequential)
+
+  def test_workers_single_numbers(self):
+    solutions = krypto_hw.solve([3, 11, 11], 11, [1], workers=2)
+    self.assertEqual([solution.expression for solution in solutions], ['11'])
+
+  def test_workers_limit(self):
+    solutions = list(krypto_hw.solve(self.nums, 11, self.sizes, workers=2, limit=3, chunk_size=1))
+    self.assertEqual(len(solutions), 3)
+
+
+class TestIndex(unittest.TestCase):
+  """Test the build_index(), save_index(), load_index() and
+  unreachable_targets() functions.
+  """
+  def setUp(self):
+    self.nums = [1, 2, 3, 4]
+    self.index = krypto_hw.build_index(self.nums, [3, 4])
+
+  def test_matches_solve_subsets(self):
+    for size in (3, 4):
+      for target in (-5, 0, 10, 24, 36):
+        self.assertEqual(sorted(self.index[size].get(target, [])),
+                         sorted(krypto_hw.solve_subsets(self.nums, target, [size])))
+
+  def test_five_numbers(self):
+    nums = [1, 3, 7, 16, 24]
+    index = krypto_hw.build_index(nums, [5])
+    for target in (0, 11, 24, 383):
+      self.assertEqual(sorted(index[5].get(target, [])), sorted(krypto_hw.solve_subsets(nums, target, [5])))
+
+  def test_integer_targets_only(self):
+    self.assertNotIn(fractions.Fraction(1, 2), self.index[4])
+    self.assertTrue(all(isinstance(target, int) for target in self.index[4]))
+
+  def test_save_and_load(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'index.json.gz')
+      krypto_hw.save_index(path, self.nums, self.index)
+      self.assertEqual(krypto_hw.load_index(path), (self.nums, self.index))
+
+  def test_unreachable_targets(self):
+    self.assertEqual(krypto_hw.unreachable_targets(self.index, 20, 30)[3], [21, 22, 23, 25, 26, 27, 28, 29, 30])
+    self.assertNotIn(24, krypto_hw.unreachable_targets(self.index, 20, 30)[4])
+
+
+class TestBruteForceSolutions(unittest.TestCase):
+  """Test the brute_force_solutions() function.
+  """
+  def test_each_solution_once(self):
+    expressions = [krypto_hw.render(expression) for _, _, expression in
+                   krypto_hw.brute_force_solutions([1, 2, 3], 6, 3)]
+    self.assertEqual(sorted(expressions), ['3 * 2 * 1', '3 * 2 / 1', '3 + 2 + 1'])
+
+  def test_operators(self):
+    solutions = krypto_hw.brute_force_solutions([1, 2, 3], 6, 3, (operator.add, operator.sub))
+    self.assertEqual([krypto_hw.render(expression) for _, _, expression in solutions], ['3 + 2 + 1'])
+
+
+@unittest.skipIf(krypto_hw.numpy is None, 'numpy is not installed')
+class TestVectorizedHits(unittest.TestCase):
+  """Test the vectorized_hits() function.
+  """
+  def test_same_hits_as_brute_force(self):
+    for size in (2, 3, 4):
+      self.assertEqual(
+        sorted(krypto_hw.vectorized_hits([1, 3, 7, 16, 24], 11, size), key=str),
+        sorted(krypto_hw.brute_force_hits([1, 3, 7, 16, 24], 11, size), key=str))
+
+  def test_operator_subset(self):
+    operators = (operator.add, operator.mul)
+    self.assertEqual(
+      sorted(krypto_hw.vectorized_hits([1, 3, 7, 16, 24], 11, 3, operators), key=str),
+      sorted(krypto_hw.brute_force_hits([1, 3, 7, 16, 24], 11, 3, operators), key=str))
+
+  def test_division_by_zero_masked(self):
+    hits = list(krypto_hw.vectorized_hits([0, 3], 0, 2))
+    self.assertIn(((0, 3), (operator.truediv,)), hits)
+    self.assertNotIn(((3, 0), (operator.truediv,)), hits)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,58 +1,24 @@
 """Unittests for sns_to_cloudwarch_logs
 """
+import collections
+import contextlib
 import datetime
+import io
+import json
 import os
+import statistics
+import sys
+import time
 import unittest
 
 from unittest import mock
 
-import lambda_sns_to_cloudwatch_logs
-
-# TODO: Testing the lambda_handler() requires mocking the aws calls, which I
-# don't have time for right now. :(
-
-# class TestLambdaHandler(unittest.TestCase):
-#   def setUp(self) -> None:
-#     self.event = {
-#       'Records': [
-#         {
-#           'Sns': {
-#             'Message': 'Hello from SNS!',
-#             'TopicArn': 'arn:aws:sns:us-east-2:123456789012:sns-lambda',
-#             'Timestamp': "2019-01-02T12:45:07.000Z",
-#           }
-#         }
-#       ]
-#     }
-
-#   def test_inputExists(self):
-#     self.assertIsNotNone(self.event)
-
-#   def test_inputEventType(self):
-#     self.assertIsInstance(self.event, dict)
-
-#   def test_inputEventRecordsType(self):
-#     self.assertIsInstance(self.event['Records'], list)
+try:
+  import moto
+except ImportError:  # moto is only needed for the lambda_handler() tests
+  moto = None
 
-#   def test_inputEventRecordsElementType(self):
-#     self.assertIsInstance(self.event['Records'][0], dict)
-
-#   def test_inputEventRecordsSnsType(self):
-#     self.assertIsInstance(self.event['Records'][0]['Sns'], dict)
-
-#   def test_inputEventRecordsSnsMessageType(self):
-#     self.assertIsInstance(self.event['Records'][0]['Sns']['Message'], str)
-
-#   def test_inputEventRecordsSnsTopicArnType(self):
-#     self.assertIsInstance(self.event['Records'][0]['Sns']['TopicArn'], str)
-
-#   def test_inputEventRecordsSnsTopicArnNumElements(self):
-#     arn_parts = self.event['Records'][0]['Sns']['TopicArn'].split(':')
-#     self.assertEqual(len(arn_parts), 6)
-
-#   def test_inputEventRecordsSnsTimestampType(self):
-#     self.assertIsInstance(datetime.datetime.fromisoformat(
-#       self.event['Records'][0]['Sns']['Timestamp']), datetime.datetime)
+import lambda_sns_to_cloudwatch_logs
 
 
 class TestIsoToEpochMs(unittest.TestCase):
@@ -114,5 +80,457 @@ class TestGetLogGroupName(unittest.TestCase):
       )
 
 
+def make_record(message='Hello from SNS!',
+                topic_arn='arn:aws:sns:us-east-2:123456789012:sns-lambda',
+                timestamp='2019-01-02T12:45:07.000Z'):
+  """Returns an SNS record, leaving out the message or timestamp if None."""
+  sns = {'TopicArn': topic_arn}
+  if message is not None:
+    sns['Message'] = message
+  if timestamp is not None:
+    sns['Timestamp'] = timestamp
+  return {'Sns': sns}
+
+
+def make_log_events(timestamps, message='x'):
+  """Returns sorted log events with the given timestamps."""
+  return [({'timestamp': timestamp, 'message': message}, index)
+          for index, timestamp in enumerate(timestamps)]
+
+
+class TestGetLogStreamName(unittest.TestCase):
+  """Test the get_log_stream_name() function.
+  """
+  def test_invalid_characters_replaced(self):
+    self.assertEqual(
+      lambda_sns_to_cloudwatch_logs.get_log_stream_name('arn:aws:sns:*:1:t'),
+      'arn_aws_sns___1_t')
+
+  def test_output_length(self):
+    name = lambda_sns_to_cloudwatch_logs.get_log_stream_name('a' * 1000)
+    self.assertEqual(len(name), 512)
+
+
+class TestGroupRecords(unittest.TestCase):
+  """Test the group_records() function.
+  """
+  def test_grouped_by_stream(self):
+    streams = lambda_sns_to_cloudwatch_logs.group_records([
+      make_record(topic_arn='arn:aws:sns:us-east-2:123456789012:a'),
+      make_record(topic_arn='arn:aws:sns:us-east-2:123456789012:b'),
+      make_record(topic_arn='arn:aws:sns:us-east-2:123456789012:a'),
+    ])
+    self.assertEqual(
+      {name: [index for _, index in log_events]
+       for name, log_events in streams.items()},
+      {'arn_aws_sns_us-east-2_123456789012_a': [0, 2],
+       'arn_aws_sns_us-east-2_123456789012_b': [1]})
+
+  def test_sorted_by_timestamp(self):
+    streams = lambda_sns_to_cloudwatch_logs.group_records([
+      make_record(message='second', timestamp='2019-01-02T12:45:08.000Z'),
+      make_record(message='first', timestamp='2019-01-02T12:45:07.000Z'),
+      make_record(message='third', timestamp='2019-01-02T12:45:08.000Z'),
+    ])
+    (log_events,) = streams.values()
+    self.assertEqual([log_event['message'] for log_event, _ in log_events],
+                     ['first', 'second', 'third'])
+
+  def test_missing_message_skipped(self):
+    streams = lambda_sns_to_cloudwatch_logs.group_records([
+      make_record(message=None), make_record()])
+    (log_events,) = streams.values()
+    self.assertEqual([index for _, index in log_events], [1])
+
+  def test_missing_timestamp_uses_current_time(self):
+    with mock.patch('time.time', return_value=1546433107.5):
+      streams = lambda_sns_to_cloudwatch_logs.group_records([
+        make_record(timestamp=None)])
+    (log_events,) = streams.values()
+    self.assertEqual(log_events[0][0]['timestamp'], 1546433107500)
+
+
+class TestBatchLogEvents(unittest.TestCase):
+  """Test the batch_log_events() function.
+  """
+  def batch_sizes(self, log_events):
+    return [len(batch) for batch in
+            lambda_sns_to_cloudwatch_logs.batch_log_events(log_events)]
+
+  def test_single_batch(self):
+    self.assertEqual(self.batch_sizes(make_log_events(range(100))), [100])
+
+  def test_no_events(self):
+    self.assertEqual(self.batch_sizes([]), [])
+
+  @mock.patch.object(lambda_sns_to_cloudwatch_logs, 'MAX_BATCH_EVENTS', 4)
+  def test_max_events(self):
+    self.assertEqual(self.batch_sizes(make_log_events(range(10))), [4, 4, 2])
+
+  def test_max_bytes(self):
+    # Each event is 262144 bytes, including its overhead
+    message = 'x' * (262144 - lambda_sns_to_cloudwatch_logs.EVENT_OVERHEAD_BYTES)
+    self.assertEqual(self.batch_sizes(make_log_events(range(9), message)),
+                     [4, 4, 1])
+
+  def test_multibyte_message(self):
+    message = '\u00e9' * 300000  # 600000 bytes in UTF-8
+    self.assertEqual(self.batch_sizes(make_log_events(range(3), message)),
+                     [1, 1, 1])
+
+  def test_max_span(self):
+    span = lambda_sns_to_cloudwatch_logs.MAX_BATCH_SPAN_MS
+    self.assertEqual(
+      self.batch_sizes(make_log_events([0, span - 1, span, span + 1])),
+      [2, 2])
+
+  def test_keeps_record_indexes(self):
+    batches = list(lambda_sns_to_cloudwatch_logs.batch_log_events(
+      make_log_events(range(3))))
+    self.assertEqual([index for _, index in batches[0]], [0, 1, 2])
+
+
+class TestRejectedLogEvents(unittest.TestCase):
+  """Test the rejected_log_events() function.
+  """
+  def test_nothing_rejected(self):
+    self.assertEqual(
+      list(lambda_sns_to_cloudwatch_logs.rejected_log_events({}, 3)), [])
+
+  def test_each_event_reported(self):
+    rejected = lambda_sns_to_cloudwatch_logs.rejected_log_events(
+      {'expiredLogEventEndIndex': 1,
+       'tooOldLogEventEndIndex': 2,
+       'tooNewLogEventStartIndex': 4}, 6)
+    self.assertEqual(list(rejected), [(0, 'expired'), (1, 'too old'),
+                                      (4, 'too new'), (5, 'too new')])
+
+
+class TestInit(unittest.TestCase):
+  """Test the init() function.
+  """
+  def setUp(self):
+    for name in ('_log_group_name', '_logs_client'):
+      patcher = mock.patch.object(lambda_sns_to_cloudwatch_logs, name, None)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  @mock.patch.dict(os.environ, {'CLOUDWATCH_LOG_GROUP_NAME': 'group',
+                                'AWS_DEFAULT_REGION': 'us-east-1'})
+  def test_resolves_configuration_once(self):
+    lambda_sns_to_cloudwatch_logs.init()
+    logs = lambda_sns_to_cloudwatch_logs.get_logs_client()
+    del os.environ['CLOUDWATCH_LOG_GROUP_NAME']
+    self.assertEqual(lambda_sns_to_cloudwatch_logs._log_group_name, 'group')  # pylint: disable=protected-access
+    self.assertIs(lambda_sns_to_cloudwatch_logs.get_logs_client(), logs)
+
+  def test_client_config(self):
+    with mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': 'us-east-1'}):
+      logs = lambda_sns_to_cloudwatch_logs.get_logs_client()
+    self.assertEqual(logs.meta.config.connect_timeout, 2)
+    self.assertEqual(logs.meta.config.retries['mode'], 'standard')
+
+  def test_raises_exception(self):
+    with mock.patch.dict('os.environ'):
+      os.environ.pop('CLOUDWATCH_LOG_GROUP_NAME', None)
+      self.assertRaises(
+        lambda_sns_to_cloudwatch_logs.MissingEnvironmentVariableException,
+        lambda_sns_to_cloudwatch_logs.init)
+
+
+class TestMetrics(unittest.TestCase):
+  """Test the Metrics class.
+  """
+  def setUp(self):
+    self.metrics = lambda_sns_to_cloudwatch_logs.Metrics()
+
+  def test_counts(self):
+    self.metrics.add('Records', 3)
+    self.metrics.add('RejectedLogEvents')
+    (document,) = self.metrics.to_emf()
+    self.assertEqual(document['Records'], 3)
+    self.assertEqual(document['RejectedLogEvents'], 1)
+    self.assertEqual(document['SkippedRecords'], 0)
+
+  def test_timer(self):
+    with self.metrics.timer('PutLogEvents'):
+      pass
+    with self.assertRaises(ValueError):
+      with self.metrics.timer('PutLogEvents'):
+        raise ValueError
+    (document,) = self.metrics.to_emf()
+    self.assertEqual(document['PutLogEventsCalls'], 2)
+    self.assertEqual(len(document['PutLogEventsLatency']), 2)
+    self.assertNotIn('CreateLogStreamLatency', document)
+
+  @mock.patch.dict(os.environ, {'AWS_LAMBDA_FUNCTION_NAME': 'function'})
+  def test_emf_document(self):
+    with self.metrics.timer('CreateLogStream'):
+      pass
+    (document,) = self.metrics.to_emf()
+    (directive,) = document['_aws']['CloudWatchMetrics']
+    self.assertEqual(directive['Namespace'],
+                     lambda_sns_to_cloudwatch_logs.METRICS_NAMESPACE)
+    self.assertEqual(directive['Dimensions'], [['FunctionName']])
+    self.assertEqual(document['FunctionName'], 'function')
+    units = {metric['Name']: metric['Unit'] for metric in directive['Metrics']}
+    self.assertEqual(units['CreateLogStreamLatency'], 'Milliseconds')
+    self.assertEqual(units['Records'], 'Count')
+    # every metric in the directive has a value
+    for name in units:
+      self.assertIn(name, document)
+
+  def test_latencies_split_across_documents(self):
+    for _ in range(250):
+      with self.metrics.timer('PutLogEvents'):
+        pass
+    documents = list(self.metrics.to_emf())
+    self.assertEqual([len(document['PutLogEventsLatency'])
+                      for document in documents], [100, 100, 50])
+    self.assertEqual(documents[0]['PutLogEventsCalls'], 250)
+    self.assertNotIn('PutLogEventsCalls', documents[1])
+
+  def test_emit(self):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+      self.metrics.emit()
+    (line,) = output.getvalue().splitlines()
+    self.assertIn('_aws', json.loads(line))
+
+
+class FakeLogsExceptions:
+  """The modeled exceptions of a logs client."""
+  class ResourceAlreadyExistsException(Exception):
+    pass
+
+  class ResourceNotFoundException(Exception):
+    pass
+
+
+class TestPutLogEvents(unittest.TestCase):
+  """Test the put_log_events() function.
+  """
+  def setUp(self):
+    patcher = mock.patch.object(lambda_sns_to_cloudwatch_logs,
+                                '_known_log_streams', set())
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.logs = mock.Mock(exceptions=FakeLogsExceptions)
+    self.logs.put_log_events.return_value = {}
+    self.log_events = [{'timestamp': 0, 'message': 'x'}]
+
+  def put(self):
+    return lambda_sns_to_cloudwatch_logs.put_log_events(
+      self.logs, 'group', 'stream', self.log_events)
+
+  def test_creates_stream_once(self):
+    self.put()
+    self.put()
+    self.logs.create_log_stream.assert_called_once_with(
+      logGroupName='group', logStreamName='stream')
+    self.assertEqual(self.logs.put_log_events.call_count, 2)
+
+  def test_stream_already_exists(self):
+    self.logs.create_log_stream.side_effect = (
+      FakeLogsExceptions.ResourceAlreadyExistsException)
+    self.put()
+    self.put()
+    self.assertEqual(self.logs.create_log_stream.call_count, 1)
+    self.assertEqual(self.logs.put_log_events.call_count, 2)
+
+  def test_recreates_deleted_stream(self):
+    self.put()
+    self.logs.put_log_events.side_effect = [
+      FakeLogsExceptions.ResourceNotFoundException, {}]
+    self.assertEqual(self.put(), {})
+    self.assertEqual(self.logs.create_log_stream.call_count, 2)
+    self.assertEqual(self.logs.put_log_events.call_count, 3)
+
+
+def make_event(records, topics=1, message_bytes=16, missing_message_every=0,
+               missing_timestamp_every=0):
+  """Returns a synthetic SNS event. Records are spread round robin over the
+  topics, with timestamps counting down from now a millisecond apart, so each
+  stream's records arrive out of order. Every missing_message_every'th record
+  has no message, and every missing_timestamp_every'th no timestamp.
+  """
+  now = datetime.datetime.now(datetime.timezone.utc)
+  event_records = []
+  for i in range(records):
+    message = f'{i} '.ljust(message_bytes, 'x')
+    timestamp = (now - datetime.timedelta(milliseconds=i)).isoformat()
+    event_records.append(make_record(
+      message=None if missing_message_every and i % missing_message_every == 0
+      else message,
+      topic_arn=f'arn:aws:sns:us-east-1:123456789012:topic-{i % topics}',
+      timestamp=None
+      if missing_timestamp_every and i % missing_timestamp_every == 0
+      else timestamp))
+  return {'Records': event_records}
+
+
+@unittest.skipIf(moto is None, 'moto is not installed')
+class TestLambdaHandler(unittest.TestCase):
+  """Test the lambda_handler() function against moto.
+  """
+  log_group_name = 'sns-to-cloudwatch-logs'
+
+  def setUp(self):
+    patchers = [
+      mock.patch.dict(os.environ, {
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'CLOUDWATCH_LOG_GROUP_NAME': self.log_group_name,
+      }),
+      moto.mock_aws(),
+      # a cold container
+      mock.patch.object(lambda_sns_to_cloudwatch_logs, '_log_group_name', None),
+      mock.patch.object(lambda_sns_to_cloudwatch_logs, '_logs_client', None),
+      mock.patch.object(lambda_sns_to_cloudwatch_logs, '_known_log_streams',
+                        set()),
+    ]
+    for patcher in patchers:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+    self.logs = lambda_sns_to_cloudwatch_logs.get_logs_client()
+    self.logs.create_log_group(logGroupName=self.log_group_name)
+    # API calls the handler makes, by operation name
+    self.api_calls = collections.Counter()
+    self.logs.meta.events.register('before-call.logs', self.count_api_call)
+
+  def count_api_call(self, model, **_):
+    self.api_calls[model.name] += 1
+
+  def invoke(self, event):
+    """Calls the handler, counting only its own API calls, and returns what
+    it printed.
+    """
+    self.api_calls.clear()
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+      lambda_sns_to_cloudwatch_logs.lambda_handler(event, None)
+    return output.getvalue()
+
+  def get_messages(self, log_stream_name):
+    """Returns the messages in a log stream, in timestamp order."""
+    paginator = self.logs.get_paginator('filter_log_events')
+    events = [log_event for page in paginator.paginate(
+      logGroupName=self.log_group_name, logStreamNames=[log_stream_name])
+              for log_event in page['events']]
+    events.sort(key=lambda log_event: log_event['timestamp'])
+    return [log_event['message'] for log_event in events]
+
+  def test_single_record(self):
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    self.invoke({'Records': [make_record(timestamp=timestamp)]})
+    self.assertEqual(
+      self.get_messages('arn_aws_sns_us-east-2_123456789012_sns-lambda'),
+      ['Hello from SNS!'])
+
+  def test_rejected_events_reported(self):
+    # more than 14 days old. (moto returns the index of the last old event as
+    # tooOldLogEventEndIndex, where AWS documents it as exclusive, so only
+    # check the first.)
+    output = self.invoke({'Records': [make_record(), make_record()]})
+    self.assertIn('Log event for record 0 was rejected as too old', output)
+
+  def test_records_by_topic_in_timestamp_order(self):
+    event = make_event(30, topics=3)
+    self.invoke(event)
+    for topic in range(3):
+      messages = self.get_messages(f'arn_aws_sns_us-east-1_123456789012_topic-{topic}')
+      self.assertEqual(messages, [f'{i} '.ljust(16, 'x')
+                                  for i in reversed(range(topic, 30, 3))])
+
+  def test_missing_message_skipped(self):
+    output = self.invoke(make_event(10, missing_message_every=5))
+    self.assertEqual(output.count('SNS event contained no message, skipping'), 2)
+    self.assertEqual(
+      len(self.get_messages('arn_aws_sns_us-east-1_123456789012_topic-0')), 8)
+
+  def test_missing_timestamp(self):
+    before = int(time.time() * 1000)
+    self.invoke(make_event(1, missing_timestamp_every=1))
+    (log_event,) = self.logs.get_log_events(
+      logGroupName=self.log_group_name,
+      logStreamName='arn_aws_sns_us-east-1_123456789012_topic-0')['events']
+    self.assertGreaterEqual(log_event['timestamp'], before)
+
+  def test_large_messages_batched(self):
+    # 4 events of 262144 bytes (including overhead) fill a batch
+    message_bytes = (262144
+                     - lambda_sns_to_cloudwatch_logs.EVENT_OVERHEAD_BYTES)
+    self.invoke(make_event(10, message_bytes=message_bytes))
+    self.assertEqual(self.api_calls['PutLogEvents'], 3)
+    self.assertEqual(
+      len(self.get_messages('arn_aws_sns_us-east-1_123456789012_topic-0')), 10)
+
+  def test_api_calls(self):
+    self.invoke(make_event(1000, topics=10))
+    self.assertEqual(self.api_calls,
+                     {'CreateLogStream': 10, 'PutLogEvents': 10})
+    # a warm container knows its streams exist
+    self.invoke(make_event(1000, topics=10))
+    self.assertEqual(self.api_calls, {'PutLogEvents': 10})
+
+  def test_existing_stream(self):
+    self.logs.create_log_stream(
+      logGroupName=self.log_group_name,
+      logStreamName='arn_aws_sns_us-east-1_123456789012_topic-0')
+    self.invoke(make_event(1))
+    self.assertEqual(
+      len(self.get_messages('arn_aws_sns_us-east-1_123456789012_topic-0')), 1)
+
+  def test_deleted_stream_recreated(self):
+    self.invoke(make_event(1))
+    self.logs.delete_log_stream(
+      logGroupName=self.log_group_name,
+      logStreamName='arn_aws_sns_us-east-1_123456789012_topic-0')
+    self.invoke(make_event(1))
+    self.assertEqual(self.api_calls,
+                     {'PutLogEvents': 2, 'CreateLogStream': 1})
+    self.assertEqual(
+      len(self.get_messages('arn_aws_sns_us-east-1_123456789012_topic-0')), 1)
+
+  def test_metrics(self):
+    output = self.invoke(make_event(10, topics=2, missing_message_every=5))
+    (document,) = [json.loads(line) for line in output.splitlines()
+                   if line.startswith('{')]
+    self.assertEqual(document['Records'], 10)
+    self.assertEqual(document['SkippedRecords'], 2)
+    self.assertEqual(document['RejectedLogEvents'], 0)
+    self.assertEqual(document['CreateLogStreamCalls'], 2)
+    self.assertEqual(document['PutLogEventsCalls'], 2)
+    self.assertEqual(len(document['PutLogEventsLatency']), 2)
+
+  def test_load(self):
+    """Replays many invocations of a mixed event, and reports the API calls
+    per record and the handler latency percentiles.
+    """
+    invocations = 20
+    event = make_event(500, topics=25, message_bytes=1024,
+                       missing_message_every=50, missing_timestamp_every=7)
+    latencies = []
+    api_calls = 0
+    for _ in range(invocations):
+      start = time.perf_counter()
+      self.invoke(event)
+      latencies.append(time.perf_counter() - start)
+      api_calls += sum(self.api_calls.values())
+
+    calls_per_record = api_calls / (invocations * len(event['Records']))
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f'\n{invocations} invocations of {len(event["Records"])} records: '
+          f'{calls_per_record:.3f} API calls per record, latency '
+          f'p50 {percentiles[49] * 1000:.1f}ms '
+          f'p90 {percentiles[89] * 1000:.1f}ms '
+          f'p99 {percentiles[98] * 1000:.1f}ms', file=sys.stderr)
+    # a put per topic, plus creating each stream once
+    self.assertEqual(api_calls, invocations * 25 + 25)
+    self.assertEqual(
+      len(self.get_messages('arn_aws_sns_us-east-1_123456789012_topic-1')),
+      invocations * 20)
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,47 @@
+"""Unittests for lambda_sns_to_cloudwatch_logs_bench
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+try:
+  import moto
+except ImportError:  # moto is only needed for the invoke samples
+  moto = None
+
+import lambda_sns_to_cloudwatch_logs_bench
+
+
+class TestMakeEvent(unittest.TestCase):
+  """Test the make_event() function.
+  """
+  def test_records_and_topics(self):
+    event = lambda_sns_to_cloudwatch_logs_bench.make_event(10, 3)
+    self.assertEqual(len(event['Records']), 10)
+    self.assertEqual(len({record['Sns']['TopicArn']
+                          for record in event['Records']}), 3)
+
+
+@unittest.skipIf(moto is None, 'moto is not installed')
+class TestBenchmark(unittest.TestCase):
+  """Smoke test the whole benchmark.
+  """
+  def test_writes_results(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'bench.json')
+      subprocess.run([sys.executable, lambda_sns_to_cloudwatch_logs_bench.__file__,
+                      '--samples', '1', '--records', '10', '--output', path],
+                     check=True, stdout=subprocess.DEVNULL)
+      with open(path) as results_file:
+        results = json.load(results_file)['results']
+    self.assertEqual(set(results),
+                     {'import', 'first_invocation', 'warm_invocation'})
+    for result in results.values():
+      self.assertEqual(len(result['samples']), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()